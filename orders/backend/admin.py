@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Shop, OrderItem, Product, Order, User, Buyer, ProductInfo, ProductParameter, Category
+from .models import Shop, OrderItem, Product, Order, User, Buyer, ProductInfo, ProductParameter, Category, ImportJob, \
+    ShopOrder
 
 
 @admin.register(Shop)
@@ -42,3 +43,13 @@ class ProductInfoAdmin(admin.ModelAdmin):
 @admin.register(ProductParameter)
 class ProductInfoAdmin(admin.ModelAdmin):
         ...
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+        ...
+
+
+@admin.register(ShopOrder)
+class ShopOrderAdmin(admin.ModelAdmin):
+        ...
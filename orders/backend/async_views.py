@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+from weakref import WeakKeyDictionary
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.authentication import CachedTokenAuthentication
+from backend.fetch import PriceListDownload, SupplierFetchError, conditional_headers
+from backend.jobs import get_executor, get_job_shop, import_download, is_resync, run_import_job
+from backend.models import ImportJob, ImportJobStatusChoices, UserTypeChoices
+from backend.views import CategoryView, ProductInfoView, ProductView, ShopView, get_import_params
+
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_ERRORS = (httpx.HTTPError, SupplierFetchError, OSError)
+
+_clients = WeakKeyDictionary()
+_downloads = set()
+
+
+def in_thread(function):
+    """sync_to_async для кода с запросами к базе.
+
+    В Django 3.2 нет асинхронного ORM: такой код выполняется в пуле потоков
+    (thread_sensitive=False), чтобы запросы шли параллельно, а не по очереди
+    в единственном потоке для синхронного кода, и закрывает соединение потока.
+    """
+    def run(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            connection.close()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def render_response(view, request, *args, **kwargs):
+    """Выполнить синхронное представление и отдать полностью готовый ответ"""
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def async_view(view_class):
+    """Асинхронное представление для чтения каталога на основе синхронного view_class"""
+    view = view_class.as_view()
+
+    async def async_catalog_view(request, *args, **kwargs):
+        return await in_thread(render_response)(view, request, *args, **kwargs)
+
+    async_catalog_view.__doc__ = view_class.__doc__
+    return async_catalog_view
+
+
+category_view = async_view(CategoryView)
+shop_view = async_view(ShopView)
+product_view = async_view(ProductView)
+product_info_view = async_view(ProductInfoView)
+
+
+async def authenticate(request):
+    """Пользователь по заголовку Authorization: Token <ключ> или None"""
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+    try:
+        user, _ = await in_thread(CachedTokenAuthentication().authenticate_credentials)(header[1])
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+def get_async_client():
+    """Клиент httpx цикла событий: его пул соединений общий для всех загрузок прайсов"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=getattr(settings, 'SUPPLIER_FETCH_TIMEOUT', 30), follow_redirects=True,
+                                   limits=httpx.Limits(max_keepalive_connections=getattr(
+                                       settings, 'SUPPLIER_POOL_SIZE', 4)))
+        _clients[loop] = client
+    return client
+
+
+async def download(url, shop, price_list):
+    """Скачать прайс-лист поставщика, не занимая поток на время ожидания ответа.
+
+    Запись во временный файл после его сброса на диск блокирует, поэтому
+    пачки пишутся в пуле потоков.
+    """
+    write = sync_to_async(price_list.write, thread_sensitive=False)
+    async with get_async_client().stream('GET', url, headers=conditional_headers(shop)) as response:
+        if response.status_code != 304:  # httpx считает 304 ошибкой
+            response.raise_for_status()
+        price_list.start(response.status_code, response.headers)
+        if not price_list.not_modified:
+            async for chunk in response.aiter_bytes():
+                await write(chunk)
+    price_list.finish()
+
+
+def fail_job(job_id, error):
+    ImportJob.objects.filter(id=job_id, status=ImportJobStatusChoices.PENDING).update(
+        status=ImportJobStatusChoices.FAILED, error=error, finished_at=timezone.now())
+
+
+def import_downloaded(job_id, price_list, shop):
+    """Импортировать скачанный прайс в пуле задач импорта и удалить его временный файл"""
+    try:
+        run_import_job(job_id, lambda job: import_download(job, price_list, shop))
+    finally:
+        price_list.close()
+
+
+async def download_job(job):
+    """Скачать прайс задачи в цикле событий и передать импорт в пул задач импорта.
+
+    Ошибка загрузки завершает задачу, её видно в статусе задачи. Если процесс
+    остановится посреди загрузки, задача останется в очереди и её подберёт
+    recover_import_jobs().
+    """
+    price_list = PriceListDownload()
+    try:
+        shop = await in_thread(get_job_shop)(job)
+        await download(job.url, None if is_resync(job) else shop, price_list)
+    except BaseException as error:
+        price_list.close()
+        if isinstance(error, DOWNLOAD_ERRORS):
+            await in_thread(fail_job)(job.id, str(error))
+        elif isinstance(error, Exception):
+            logger.exception('Сбой загрузки прайса задачи импорта %s', job.id)
+            await in_thread(fail_job)(job.id, 'Внутренняя ошибка импорта')
+        else:
+            raise
+    else:
+        get_executor().submit(import_downloaded, job.id, price_list, shop)
+
+
+async def shop_update(request):
+    """Обновить прайс поставщика: скачать его асинхронно и поставить импорт в очередь задач.
+
+    Как и ShopUpdateView, представление сразу отвечает 202 с id задачи.
+    Под ASGI прайс скачивается фоновой задачей цикла событий, так что
+    медленный поставщик не держит ни клиента, ни поток; результат загрузки
+    и импорта виден в статусе задачи. Под WSGI загрузка идёт до ответа.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'Status': False, 'Errors': 'Метод не поддерживается'}, status=405)
+    user = await authenticate(request)
+    if user is None or user.type != UserTypeChoices.SHOP:
+        return JsonResponse({'Status': False, 'Errors': 'Требуется авторизация магазина'}, status=403)
+
+    try:
+        data = json.loads(request.body) if request.content_type == 'application/json' else request.POST
+    except ValueError:
+        return JsonResponse({'Status': False, 'Errors': 'Некорректный JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'Status': False, 'Errors': 'Некорректный запрос'}, status=400)
+    url, mode, error = get_import_params(data)
+    if error:
+        return JsonResponse({'Status': False, 'Errors': error})
+
+    job = await in_thread(ImportJob.objects.create)(user_id=user.id, url=url, mode=mode)
+    if isinstance(request, ASGIRequest):
+        # цикл событий хранит только слабые ссылки на задачи
+        task = asyncio.ensure_future(download_job(job))
+        _downloads.add(task)
+        task.add_done_callback(_downloads.discard)
+    else:
+        # под WSGI цикл событий живёт, только пока выполняется запрос
+        await download_job(job)
+    return JsonResponse({'Status': True, 'job': job.id}, status=202)
+
+
+async def wait_for_downloads():
+    """Дождаться фоновых загрузок прайсов текущего цикла событий, например перед его остановкой"""
+    loop = asyncio.get_running_loop()
+    tasks = [task for task in _downloads if task.get_loop() is loop]
+    while tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        tasks = [task for task in _downloads if task.get_loop() is loop]
+
+
+# csrf_exempt в Django 3.2 оборачивает представление синхронной функцией, поэтому отметка ставится напрямую
+shop_update.csrf_exempt = True
@@ -0,0 +1,73 @@
+import copy
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.cache import LRUCache
+
+
+token_cache = LRUCache(getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000))
+
+
+def get_shared_cache():
+    alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def token_stamp_key(key):
+    return f'backend:auth:token:{key}'
+
+
+def get_token_stamp(key):
+    """Отметка последнего сброса токена в общем кэше (None, если его нет или сбросов не было)"""
+    shared_cache = get_shared_cache()
+    return shared_cache.get(token_stamp_key(key)) if shared_cache else None
+
+
+def forget_tokens(*keys):
+    """Удалить токены из кэша аутентификации этого и (через общий кэш) остальных процессов.
+
+    Сброс выполняется после коммита, чтобы другой процесс не закэшировал
+    заново ещё не изменённого пользователя.
+    """
+    def forget():
+        for key in keys:
+            token_cache.delete(key)
+        shared_cache = get_shared_cache()
+        if shared_cache and keys:
+            stamp = uuid.uuid4().hex
+            shared_cache.set_many({token_stamp_key(key): stamp for key in keys},
+                                  getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 5))
+    transaction.on_commit(forget)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кэшем пользователей в памяти процесса.
+
+    Проверенный токен и его пользователь хранятся в LRU не дольше
+    AUTH_TOKEN_CACHE_TTL секунд, так что в установившемся режиме запрос
+    не обращается к базе. Удаление токена и изменение пользователя
+    (блокировка, смена типа) сбрасывают запись сигналами. Если задан общий
+    кэш AUTH_TOKEN_CACHE_ALIAS, сброс публикуется в нём отметкой токена,
+    которая сверяется при каждом попадании, и виден всем процессам сразу;
+    без него, как и после QuerySet.update(), - после истечения TTL.
+    """
+
+    def authenticate_credentials(self, key):
+        stamp = get_token_stamp(key)
+        entry = token_cache.get(key)
+        if entry is None or entry[2] < time.monotonic() or entry[3] != stamp:
+            # отметка прочитана до запроса к базе, так что сброс во время него не потеряется
+            user, token = super().authenticate_credentials(key)
+            entry = (user, token, time.monotonic() + getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 5), stamp)
+            token_cache.set(key, entry)
+        user, token, *_ = entry
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        # каждому запросу - своя копия, чтобы изменения в представлении не попадали в кэш
+        return copy.copy(user), token
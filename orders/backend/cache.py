@@ -0,0 +1,180 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from backend.models import CatalogVersion, Shop
+
+
+CATALOG_VERSION_ID = 1
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш в памяти процесса"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return default
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+catalog_cache = LRUCache(getattr(settings, 'CATALOG_CACHE_SIZE', 1024))
+
+
+def get_catalog_stamp():
+    """Версии каталога и остатков и время их смены (один запрос по первичному ключу)"""
+    stamp = CatalogVersion.objects.filter(id=CATALOG_VERSION_ID).values_list(
+        'version', 'updated_at', 'stock_version', 'stock_updated_at').first()
+    return stamp or (0, None, 0, None)
+
+
+def bump_catalog_stamp(**changes):
+    updated = CatalogVersion.objects.filter(id=CATALOG_VERSION_ID).update(**changes)
+    if not updated:
+        try:
+            with transaction.atomic():
+                CatalogVersion.objects.create(id=CATALOG_VERSION_ID)
+        except IntegrityError:
+            pass
+        bump_catalog_stamp(**changes)
+
+
+def bump_catalog_version():
+    bump_catalog_stamp(version=F('version') + 1, updated_at=timezone.now())
+
+
+def bump_stock_version(shop_ids):
+    now = timezone.now()
+    Shop.objects.filter(id__in=shop_ids).update(stock_version=F('stock_version') + 1, stock_changed_at=now)
+    bump_catalog_stamp(stock_version=F('stock_version') + 1, stock_updated_at=now)
+
+
+def catalog_changed():
+    """Сменить версию каталога после коммита текущей транзакции.
+
+    Версия меняется коротким отдельным UPDATE, а не внутри транзакции импорта,
+    чтобы параллельные записи не ждали блокировку строки версии.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+def shop_changed(**filters):
+    """Отметить изменение прайса или статуса магазина(ов), выбранных по filters"""
+    Shop.objects.filter(**filters).update(version=F('version') + 1, changed_at=timezone.now())
+    catalog_changed()
+
+
+def stock_changed(shop_ids):
+    """Отметить изменение остатков магазинов после коммита текущей транзакции.
+
+    Меняется только штамп остатков, от которого зависят списки с количеством
+    товара (stock_dependent): версии каталога и магазинов, а с ними кэш
+    остальных списков и сегменты поиска и фасетов, остаются прежними.
+    """
+    transaction.on_commit(lambda: bump_stock_version(shop_ids))
+
+
+def get_shared_cache():
+    alias = getattr(settings, 'CATALOG_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+class CatalogCacheMixin:
+    """Условные GET и кэширование готового JSON списков каталога.
+
+    Ответ зависит только от версии каталога (или версии магазина, если список
+    отфильтрован по shop_filter_param), поэтому ETag и Last-Modified считаются
+    по ним одним запросом: на совпавший If-None-Match / If-Modified-Since
+    отдаётся 304 без выборки и сериализации данных.
+
+    Тот же штамп входит в ключ кэша, так что после импорта прайса или смены
+    статуса магазина старые ответы просто перестают запрашиваться. Списки
+    с остатками (stock_dependent) учитывают ещё и штамп остатков, который
+    меняется при оформлении заказов. Первый уровень кэша - LRU в памяти
+    процесса, второй (необязательный) - кэш Django из настройки
+    CATALOG_CACHE_ALIAS, общий для всех процессов.
+    """
+    shop_filter_param = None
+    stock_dependent = False
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        scope, version, changed_at = self.get_change_stamp(request)
+        key = self.get_catalog_cache_key(request, scope, version)
+        etag = f'"{hashlib.sha1(key.encode("utf-8")).hexdigest()}"'
+        last_modified = int(changed_at.timestamp()) if changed_at else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(self.get_cached_content(request, key, *args, **kwargs),
+                                    content_type=request.accepted_renderer.media_type)
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def get_change_stamp(self, request):
+        shop_id = request.query_params.get(self.shop_filter_param) if self.shop_filter_param else None
+        if shop_id and shop_id.isdigit():
+            stamp = Shop.objects.filter(id=shop_id).values_list(
+                'version', 'changed_at', 'stock_version', 'stock_changed_at').first()
+            if stamp:
+                return (f'shop-{shop_id}', *self.combine_stamp(*stamp))
+        return ('catalog', *self.combine_stamp(*get_catalog_stamp()))
+
+    def combine_stamp(self, version, changed_at, stock_version, stock_changed_at):
+        """Версия ответа и время его изменения с учётом остатков, если список от них зависит"""
+        if not self.stock_dependent:
+            return version, changed_at
+        return f'{version}.{stock_version}', max(filter(None, (changed_at, stock_changed_at)), default=None)
+
+    def get_cached_content(self, request, key, *args, **kwargs):
+        content = catalog_cache.get(key)
+        if content is None:
+            shared_cache = get_shared_cache()
+            content = shared_cache.get(key) if shared_cache else None
+            if content is None:
+                response = super().list(request, *args, **kwargs)
+                content = request.accepted_renderer.render(response.data, request.accepted_media_type,
+                                                           self.get_renderer_context())
+                if shared_cache:
+                    shared_cache.set(key, content, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+            catalog_cache.set(key, content)
+        return content
+
+    def get_catalog_cache_key(self, request, scope, version):
+        raw_key = f'{self.__class__.__name__}:{request.accepted_media_type}:{request.build_absolute_uri()}'
+        return f'backend:catalog:{scope}:{version}:{hashlib.sha1(raw_key.encode("utf-8")).hexdigest()}'
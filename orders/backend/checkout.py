@@ -0,0 +1,105 @@
+from django.db import connection, transaction
+from django.db.models import Case, F, When
+
+from backend.cache import stock_changed
+from backend.models import Buyer, Order, OrderItem, OrderStateChoices, ProductInfo, ShopOrder, ShopStatusChoices
+
+
+class CheckoutError(Exception):
+    """Заказ не может быть оформлен"""
+
+
+class InsufficientStock(CheckoutError):
+    """Недостаточно товара для части позиций заказа"""
+
+    def __init__(self, lines):
+        super().__init__('Недостаточно товара')
+        self.lines = lines
+
+
+class ShopClosed(CheckoutError):
+    """Часть позиций заказа из магазинов, которые не принимают заказы"""
+
+    def __init__(self, lines):
+        super().__init__('Магазин не принимает заказы')
+        self.lines = lines
+
+
+def build_shop_orders(order, buyer, items):
+    """Проекция заказа по магазинам: по одному ShopOrder на магазин с его строками и суммой"""
+    shop_orders = {}
+    for item in items:
+        shop_order = shop_orders.get(item.shop_id)
+        if shop_order is None:
+            shop_order = shop_orders[item.shop_id] = ShopOrder(
+                shop_id=item.shop_id, order_id=order.id, state=order.state, created_at=order.created_at,
+                buyer=buyer, subtotal=0, lines=[])
+        shop_order.subtotal += item.price * item.quantity
+        shop_order.lines.append({'id': item.id, 'product_info': item.product_info_id,
+                                 'product_name': item.product_name, 'price': item.price, 'quantity': item.quantity})
+    return list(shop_orders.values())
+
+
+def checkout_basket(user_id, order_id, buyer_id):
+    """Оформить корзину пользователя и списать остатки товаров.
+
+    Корзина и позиции магазинов блокируются SELECT ... FOR UPDATE, позиции -
+    всегда в порядке id, поэтому заказы с общими товарами ждут друг друга,
+    а не попадают во взаимную блокировку. Если какой-то магазин закрыт,
+    ShopClosed перечисляет его строки, а если какой-то позиции не хватает,
+    InsufficientStock сообщает обо всех таких строках сразу; в обоих случаях
+    ничего не списывается. Иначе остатки уменьшаются одним UPDATE ... CASE.
+
+    В позиции заказа копируются цена, названия товара и магазина, а в заказ -
+    итоговая сумма, чтобы история заказов не зависела от будущих импортов.
+    Для каждого магазина из заказа записывается ShopOrder.
+    """
+    with transaction.atomic():
+        buyer = Buyer.objects.filter(id=buyer_id, user_id=user_id).values(
+            'id', 'name', 'address', 'phone', 'user').first()
+        if buyer is None:
+            raise CheckoutError('Контакт не найден')
+        order = Order.objects.select_for_update().filter(
+            id=order_id, user_id=user_id, state=OrderStateChoices.BASKET).first()
+        if order is None:
+            raise CheckoutError('Корзина не найдена')
+
+        items = list(OrderItem.objects.filter(order_id=order.id).only('id', 'product_info_id', 'quantity'))
+        lines = {item.product_info_id: item.quantity for item in items}
+        if not lines:
+            raise CheckoutError('Добавьте позиции в заказ')
+        # блокируются только строки позиций, но не присоединённые магазины
+        lock_of = {'of': ('self',)} if connection.features.has_select_for_update_of else {}
+        offers = ProductInfo.objects.select_for_update(**lock_of).filter(id__in=lines).order_by('id').values(
+            'id', 'quantity', 'price', 'shop_id', 'shop__state', 'shop__name', 'product__name')
+        stock = {offer['id']: offer for offer in offers}
+        ordered_lines = sorted(lines.items(), key=lambda line: line[0] or 0)
+
+        closed = [{'product_info': product_info_id, 'shop': stock[product_info_id]['shop_id']}
+                  for product_info_id, _ in ordered_lines
+                  if product_info_id in stock and stock[product_info_id]['shop__state'] != ShopStatusChoices.OPEN]
+        if closed:
+            raise ShopClosed(closed)
+        insufficient = [{'product_info': product_info_id, 'requested': quantity,
+                         'available': stock[product_info_id]['quantity'] if product_info_id in stock else 0}
+                        for product_info_id, quantity in ordered_lines
+                        if product_info_id not in stock or stock[product_info_id]['quantity'] < quantity]
+        if insufficient:
+            raise InsufficientStock(insufficient)
+
+        ProductInfo.objects.filter(id__in=lines).update(quantity=Case(
+            *[When(id=product_info_id, then=F('quantity') - quantity) for product_info_id, quantity in lines.items()]))
+        for item in items:
+            offer = stock[item.product_info_id]
+            item.price, item.product_name = offer['price'], offer['product__name']
+            item.shop_id, item.shop_name = offer['shop_id'], offer['shop__name']
+        OrderItem.objects.bulk_update(items, ['price', 'product_name', 'shop', 'shop_name'])
+        order.state, order.buyer_id = OrderStateChoices.NEW, buyer_id
+        order.total_price = sum(item.price * item.quantity for item in items)
+        Order.objects.filter(id=order.id).update(state=order.state, buyer_id=buyer_id, total_price=order.total_price)
+        ShopOrder.objects.bulk_create(build_shop_orders(order, buyer, items))
+
+        # штамп остатков меняется после коммита, чтобы параллельные
+        # оформления не ждали блокировку строки магазина
+        stock_changed({offer['shop_id'] for offer in stock.values()})
+    return order
@@ -0,0 +1,147 @@
+from collections import defaultdict
+from functools import reduce
+from operator import and_, or_
+
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from rest_framework.filters import BaseFilterBackend
+
+from backend.models import ProductInfo, Shop
+from backend.search import ProductSearchFilter, ShopIndex
+
+
+class FacetSegment:
+    """Значения параметров позиций одного магазина: {параметр: {значение: {id позиций}}}"""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.ids = set()
+        self.postings = defaultdict(lambda: defaultdict(set))
+        for product_info_id, parameters in rows:
+            self.ids.add(product_info_id)
+            for name, value in parameters.items():
+                self.postings[name][value].add(product_info_id)
+
+    def select(self, name, values, ids):
+        """Позиции из ids, у которых параметр name принимает одно из значений values"""
+        postings = self.postings.get(name, {})
+        selected = set()
+        for value in values:
+            selected |= postings.get(value, set()) & ids
+        return selected
+
+    def count(self, name, ids):
+        """{значение: число позиций из ids} для параметра name"""
+        counts = {}
+        for value, product_info_ids in self.postings[name].items():
+            total = len(product_info_ids & ids)
+            if total:
+                counts[value] = total
+        return counts
+
+
+def build_facet_segment(shop_id, version):
+    """Фасетный сегмент магазина из документов параметров позиций"""
+    rows = ProductInfo.objects.filter(shop_id=shop_id).values_list('id', 'parameters')
+    return FacetSegment(version, rows.iterator())
+
+
+class FacetIndex(ShopIndex):
+    """Фасетный индекс параметров товаров в памяти процесса"""
+
+    def __init__(self):
+        super().__init__(build_facet_segment)
+
+    def filter(self, shop_ids, conditions, with_facets=False):
+        """Отобрать позиции по условиям {параметр: {значения}} и посчитать фасеты.
+
+        shop_ids - {shop_id: {id позиций текущей выборки} или None, если
+        выбраны все позиции магазина}. Значения одного параметра объединяются
+        через ИЛИ, разные параметры - через И. Счётчики параметра считаются
+        с учётом условий на все остальные параметры, чтобы выбор одного
+        значения не скрывал соседние.
+        """
+        matched = set()
+        facets = defaultdict(lambda: defaultdict(int))
+        for shop_id, segment in self.get_segments(list(shop_ids)):
+            ids = segment.ids if shop_ids[shop_id] is None else shop_ids[shop_id]
+            selected = {name: segment.select(name, values, ids) for name, values in conditions.items()}
+            shop_matched = set(ids)
+            for product_info_ids in selected.values():
+                shop_matched &= product_info_ids
+            matched |= shop_matched
+
+            if not with_facets:
+                continue
+            for name in segment.postings:
+                others = set(ids)
+                for other_name, product_info_ids in selected.items():
+                    if other_name != name:
+                        others &= product_info_ids
+                for value, total in segment.count(name, others).items():
+                    facets[name][value] += total
+
+        facets = {name: dict(sorted(values.items(), key=lambda item: (-item[1], item[0])))
+                  for name, values in sorted(facets.items())}
+        return matched, facets
+
+
+facet_index = FacetIndex()
+
+
+class ParameterFilter(BaseFilterBackend):
+    """Фильтрация позиций по параметрам ?param=Цвет:черный и подсчёт фасетов ?facets=1.
+
+    Условия и счётчики считаются по FacetIndex без соединений с таблицей
+    параметров; фасеты сохраняются в request.facets для ответа. В PostgreSQL
+    запрос без фасетов фильтруется в базе по GIN-индексу (jsonb_path_ops)
+    на документе параметров позиции.
+    """
+    param_query_param = 'param'
+    facets_query_param = 'facets'
+
+    def filter_queryset(self, request, queryset, view):
+        conditions = self.get_conditions(request)
+        with_facets = request.query_params.get(self.facets_query_param) in ('1', 'true')
+        if not conditions and not with_facets:
+            return queryset
+        if connection.vendor == 'postgresql' and not with_facets:
+            return queryset.filter(self.get_containment(conditions))
+
+        matched, facets = facet_index.filter(self.get_selection(request, queryset, view), conditions, with_facets)
+        if with_facets:
+            request.facets = facets
+        return queryset.filter(id__in=matched) if conditions else queryset
+
+    @staticmethod
+    def get_selection(request, queryset, view):
+        """Текущая выборка для FacetIndex.filter: {shop_id: {id позиций} или None}.
+
+        Пока выборку ограничивает только магазин, из базы берутся лишь id
+        магазинов (по проверке EXISTS на магазин), а позиции - из сегментов.
+        Фильтр по категории и поиск сужают выборку внутри магазина, и тогда
+        выбираются id её позиций.
+        """
+        shop_param = getattr(view, 'shop_filter_param', None)
+        narrowing = [name for name in getattr(view, 'filterset_fields', ()) if name != shop_param]
+        if any(request.query_params.get(name) for name in [*narrowing, ProductSearchFilter.search_param]):
+            shop_ids = defaultdict(set)
+            for product_info_id, shop_id in queryset.order_by().values_list('id', 'shop_id'):
+                shop_ids[shop_id].add(product_info_id)
+            return shop_ids
+        shops = Shop.objects.filter(Exists(queryset.order_by().filter(shop_id=OuterRef('id'))))
+        return dict.fromkeys(shops.values_list('id', flat=True))
+
+    @staticmethod
+    def get_containment(conditions):
+        """Условия вида parameters @> {"Цвет": "черный"}: значения через ИЛИ, параметры через И"""
+        return reduce(and_, (reduce(or_, (Q(parameters__contains={name: value}) for value in sorted(values)))
+                             for name, values in conditions.items()))
+
+    def get_conditions(self, request):
+        conditions = defaultdict(set)
+        for condition in request.query_params.getlist(self.param_query_param):
+            name, separator, value = condition.partition(':')
+            if separator and name:
+                conditions[name].add(value)
+        return conditions
@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+class SupplierFetchError(ValueError):
+    """Прайс поставщика не уложился в ограничения по размеру или времени загрузки"""
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url):
+    """Сессия requests с пулом соединений, общая для всех загрузок с одного хоста"""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=getattr(settings, 'SUPPLIER_POOL_SIZE', 4))
+            session.mount(f'{parts.scheme}://', adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            _sessions[key] = session
+        return session
+
+
+def conditional_headers(shop):
+    """Заголовки условного запроса по валидаторам прайса, сохранённым у магазина"""
+    headers = {}
+    if shop is not None and shop.price_etag:
+        headers['If-None-Match'] = shop.price_etag
+    if shop is not None and shop.price_last_modified:
+        headers['If-Modified-Since'] = shop.price_last_modified
+    return headers
+
+
+class PriceListDownload:
+    """Скачиваемый прайс-лист.
+
+    Распакованное содержимое пишется во временный файл (в памяти, пока не
+    превысит IMPORT_SPOOL_SIZE) с подсчётом SHA-256 и проверкой ограничений
+    SUPPLIER_MAX_SIZE и SUPPLIER_FETCH_MAX_TIME.
+    """
+
+    def __init__(self):
+        self.stream = SpooledTemporaryFile(max_size=getattr(settings, 'IMPORT_SPOOL_SIZE', 10 * 1024 * 1024))
+        self.max_size = getattr(settings, 'SUPPLIER_MAX_SIZE', 100 * 1024 * 1024)
+        self.deadline = time.monotonic() + getattr(settings, 'SUPPLIER_FETCH_MAX_TIME', 300)
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.not_modified = False
+        self.etag = self.last_modified = ''
+
+    def start(self, status_code, headers):
+        """Разобрать ответ поставщика до чтения тела"""
+        self.not_modified = status_code == 304
+        self.etag = headers.get('ETag', '')
+        self.last_modified = headers.get('Last-Modified', '')
+        length = headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > self.max_size:
+            raise SupplierFetchError(f'Прайс-лист больше {self.max_size} байт')
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise SupplierFetchError(f'Прайс-лист больше {self.max_size} байт')
+        if time.monotonic() > self.deadline:
+            raise SupplierFetchError('Превышено время загрузки прайс-листа')
+        self.hash.update(chunk)
+        self.stream.write(chunk)
+
+    def finish(self):
+        self.stream.seek(0)
+
+    def close(self):
+        self.stream.close()
+
+    @property
+    def content_hash(self):
+        return self.hash.hexdigest()
+
+    def is_unchanged(self, shop):
+        """Поставщик ответил 304 или содержимое совпало с уже импортированным"""
+        return shop is not None and (self.not_modified or shop.price_hash == self.content_hash)
+
+    def validators(self):
+        """Поля магазина для условного запроса в следующий раз"""
+        return {'price_etag': self.etag[:200], 'price_last_modified': self.last_modified[:50],
+                'price_hash': self.content_hash}
+
+
+@contextmanager
+def fetch_price_list(url, shop=None):
+    """Скачать прайс-лист через общий пул соединений хоста.
+
+    Если у магазина сохранены валидаторы прошлого импорта, запрос условный;
+    на ответ 304 тело не читается и download.not_modified истинно.
+    """
+    download = PriceListDownload()
+    timeout = getattr(settings, 'SUPPLIER_FETCH_TIMEOUT', 30)
+    try:
+        with get_session(url).get(url, headers=conditional_headers(shop), stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            download.start(response.status_code, response.headers)
+            if not download.not_modified:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    download.write(chunk)
+        download.finish()
+        yield download
+    finally:
+        download.close()
@@ -0,0 +1,348 @@
+import hashlib
+import json
+import logging
+import time
+from contextlib import nullcontext
+from itertools import islice
+
+import yaml
+from django.db import connection, transaction
+
+from backend.cache import catalog_changed, shop_changed
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, ImportModeChoices, \
+    OrderItem, OrderStateChoices
+from backend.search import build_search_text
+
+
+logger = logging.getLogger(__name__)
+
+# Ограничение на число параметров в одном запросе (SQLite старых версий - 999)
+QUERY_CHUNK_SIZE = 500
+
+
+def chunked(iterable, size):
+    """Разбить последовательность на списки длиной не более size"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parameters_fingerprint(parameters):
+    """Отпечаток параметров товара для сравнения с сохранённым состоянием"""
+    payload = json.dumps(sorted((str(key), str(value)) for key, value in parameters.items()), ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def parameters_document(parameters):
+    """Параметры товара в виде, в котором они хранятся в ProductParameter: {название: значение}"""
+    return {str(key): str(value) for key, value in parameters.items()}
+
+
+def read_price_list(stream):
+    """Потоковое чтение YAML прайс-листа.
+
+    Возвращает словарь с ключами прайса, где 'goods' - итератор товаров.
+    Если раздел goods идёт после shop и categories, товары разбираются по
+    одному по мере чтения потока. Иначе (например, у yaml.dump() с sort_keys
+    порядок categories, goods, shop) раздел goods читается целиком в память.
+    """
+    loader = open_price_list(stream)
+    data = {}
+    while not loader.check_event(yaml.MappingEndEvent):
+        key = loader.construct_document(loader.compose_node(None, None))
+        if key == 'goods' and {'shop', 'categories'}.issubset(data):
+            data['goods'] = iter_goods(loader)
+            return data
+        data[key] = loader.construct_document(loader.compose_node(None, None))
+    loader.dispose()
+    data['goods'] = iter(data.get('goods') or ())
+    return data
+
+
+def read_shop_name(stream):
+    """Название магазина из прайс-листа; значения остальных ключей, в том числе товары, не разбираются"""
+    loader = open_price_list(stream)
+    try:
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(loader.compose_node(None, None))
+            if key == 'shop':
+                return loader.construct_document(loader.compose_node(None, None))
+            skip_node(loader)
+        raise KeyError('shop')
+    finally:
+        loader.dispose()
+
+
+def open_price_list(stream):
+    """Загрузчик YAML, остановленный перед первым ключом корневого словаря прайса"""
+    loader = yaml.FullLoader(stream)
+    loader.get_event()  # StreamStartEvent
+    if not loader.check_event(yaml.DocumentStartEvent):
+        raise ValueError('Пустой прайс-лист')
+    loader.get_event()
+    if not loader.check_event(yaml.MappingStartEvent):
+        raise ValueError('Некорректный формат прайс-листа')
+    loader.get_event()
+    return loader
+
+
+def skip_node(loader):
+    """Пропустить очередной узел YAML по событиям парсера, не строя его"""
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def iter_goods(loader):
+    """Выдавать товары из раздела goods по одному"""
+    try:
+        if not loader.check_event(yaml.SequenceStartEvent):
+            goods = loader.construct_document(loader.compose_node(None, None))
+            yield from goods or ()
+            return
+        loader.get_event()
+        while not loader.check_event(yaml.SequenceEndEvent):
+            yield loader.construct_document(loader.compose_node(None, None))
+    finally:
+        loader.dispose()
+
+
+class ImportResult:
+    """Итоги импорта прайс-листа"""
+
+    def __init__(self, shop, rows, duration, created=0, updated=0, deleted=0, unchanged=False):
+        self.shop = shop
+        self.rows = rows
+        self.duration = duration
+        self.created = created
+        self.updated = updated
+        self.deleted = deleted
+        self.unchanged = unchanged
+
+    @property
+    def rows_per_sec(self):
+        return round(self.rows / self.duration, 1) if self.duration else float(self.rows)
+
+    def as_dict(self):
+        return {'shop': self.shop.name, 'rows': self.rows, 'created': self.created, 'updated': self.updated,
+                'deleted': self.deleted, 'duration': round(self.duration, 3), 'rows_per_sec': self.rows_per_sec}
+
+
+class PriceListImporter:
+    """Импорт прайс-листа поставщика пакетными запросами.
+
+    Названия категорий, товаров и параметров сопоставляются с id в памяти,
+    позиции прайса записываются пакетами в одной транзакции.
+
+    У магазина одна позиция на товар: при повторе товара в прайсе побеждает
+    последнее вхождение.
+
+    В режиме replace позиции магазина удаляются и создаются заново.
+    В режиме diff каждый товар сравнивается с сохранённой позицией того же
+    продукта (цена, количество и отпечаток параметров): создаются только новые,
+    обновляются изменившиеся и удаляются пропавшие из прайса позиции, так что
+    id неизменных позиций и ссылающиеся на них элементы заказов сохраняются.
+
+    При atomic=False (параллельный офлайн-импорт) каждая пачка пишется в своей
+    короткой транзакции, а общие справочники (товары, категории, параметры)
+    создаются до неё через INSERT ... ON CONFLICT DO NOTHING, чтобы процессы
+    не держали блокировки уникальных названий друг против друга. При
+    atomic=True то же делает prepare_names() перед run().
+    """
+
+    batch_size = 1000
+
+    def __init__(self, user_id, url, batch_size=None, mode=ImportModeChoices.REPLACE, atomic=True):
+        self.user_id = user_id
+        self.url = url
+        if batch_size:
+            self.batch_size = batch_size
+        self.mode = mode
+        self.atomic = atomic
+        self.categories = {}
+        self.products = {}
+        self.parameters = {}
+        self.stored = {}
+        self.seen = set()
+        self.created = self.updated = self.deleted = 0
+        self.names_created = 0
+
+    def run(self, data, progress=None):
+        """Импортировать прайс; progress(rows) вызывается после каждой пачки товаров"""
+        started = time.perf_counter()
+        rows = 0
+        with transaction.atomic() if self.atomic else nullcontext():
+            shop, created = Shop.objects.get_or_create(name=data['shop'], user_id=self.user_id, url=self.url)
+            # версия магазина меняется, только если импорт действительно что-то изменил
+            changed = self.import_categories(shop, data['categories']) or created
+            if self.mode == ImportModeChoices.DIFF:
+                self.load_stored(shop)
+            else:
+                changed |= self.delete_product_infos(ProductInfo.objects.filter(shop_id=shop.id)) > 0
+
+            for goods in chunked(data['goods'], self.batch_size):
+                self.resolve_names(Product, [item['name'] for item in goods], self.products)
+                self.resolve_names(Parameter, [key for item in goods for key in item['parameters']], self.parameters)
+                with transaction.atomic(savepoint=False):
+                    batch_changed = self.sync_goods(shop, goods)
+                    if batch_changed and not self.atomic:
+                        shop_changed(id=shop.id)
+                changed |= batch_changed
+                rows += len(goods)
+                if progress:
+                    progress(rows)
+
+            if self.mode == ImportModeChoices.DIFF:
+                changed |= self.delete_missing() > 0
+            if changed:
+                shop_changed(id=shop.id)
+
+        result = ImportResult(shop, rows, time.perf_counter() - started, self.created, self.updated, self.deleted)
+        logger.info('Импорт прайса магазина %s (%s): %s позиций за %.2f с (%s строк/с), '
+                    'создано %s, обновлено %s, удалено %s', shop.name, self.mode, result.rows, result.duration,
+                    result.rows_per_sec, result.created, result.updated, result.deleted)
+        return result
+
+    def prepare_names(self, data):
+        """Создать недостающие категории, товары и параметры прайса до транзакции импорта.
+
+        Каждая пачка названий вставляется своим коротким запросом вне
+        транзакции, так что параллельный импорт с теми же новыми названиями
+        не ждёт коммита всего прайса; run() затем берёт id из кэша. Новые
+        товары и категории сразу видны в списках каталога, поэтому его
+        версия меняется.
+        """
+        names_created = self.names_created
+        self.resolve_names(Category, [category['name'] for category in data['categories']], self.categories)
+        for goods in chunked(data['goods'], self.batch_size):
+            self.resolve_names(Product, [item['name'] for item in goods], self.products)
+            self.resolve_names(Parameter, [key for item in goods for key in item['parameters']], self.parameters)
+        if self.names_created > names_created:
+            catalog_changed()
+
+    def import_categories(self, shop, categories):
+        """Связать магазин с категориями прайса; True, если добавились новые связи"""
+        names = [category['name'] for category in categories]
+        category_ids = set(self.resolve_names(Category, names, self.categories).values())
+        new_ids = category_ids - set(shop.categories.values_list('id', flat=True))
+        shop.categories.add(*new_ids)
+        return bool(new_ids)
+
+    def load_stored(self, shop):
+        """Загрузить текущее состояние позиций магазина: {product_id: (id, price, quantity, fingerprint)}"""
+        self.stored = {row[0]: row[1:] for row in ProductInfo.objects.filter(shop_id=shop.id).order_by('id').values_list(
+            'product_id', 'id', 'price', 'quantity', 'fingerprint')}
+
+    def sync_goods(self, shop, goods):
+        """Записать пачку товаров, сравнив её с self.stored (в режиме replace он пуст).
+
+        Возвращает True, если какие-то позиции созданы или обновлены.
+        """
+        incoming = {self.products[item['name']]: item for item in goods}
+        self.seen.update(incoming)
+
+        to_create, to_update = [], []
+        for product_id, item in incoming.items():
+            fingerprint = parameters_fingerprint(item['parameters'])
+            product_info = ProductInfo(product_id=product_id, shop_id=shop.id, price=item['price'],
+                                       quantity=item['quantity'], fingerprint=fingerprint,
+                                       search_text=build_search_text(item['name'], item['parameters']),
+                                       parameters=parameters_document(item['parameters']))
+            stored = self.stored.get(product_id)
+            if stored is None:
+                to_create.append((product_info, item))
+            elif stored[1:] != (product_info.price, product_info.quantity, fingerprint):
+                product_info.id = stored[0]
+                to_update.append((product_info, item, stored[3] != fingerprint))
+
+        if to_update:
+            ProductInfo.objects.bulk_update([product_info for product_info, _, _ in to_update],
+                                            ['price', 'quantity', 'fingerprint', 'search_text', 'parameters'],
+                                            batch_size=self.batch_size)
+            changed = [(product_info, item) for product_info, item, params_changed in to_update if params_changed]
+            for ids_chunk in chunked([product_info.id for product_info, _ in changed], QUERY_CHUNK_SIZE):
+                ProductParameter.objects.filter(product_info_id__in=ids_chunk).delete()
+            if changed:
+                self.create_parameters(*zip(*changed))
+            self.updated += len(to_update)
+
+        if to_create:
+            self.create_product_infos(shop, [product_info for product_info, _ in to_create])
+            self.create_parameters(*zip(*to_create))
+            self.created += len(to_create)
+
+        for product_info, *_ in to_create + to_update:
+            self.stored[product_info.product_id] = (product_info.id, product_info.price, product_info.quantity,
+                                                    product_info.fingerprint)
+        return bool(to_create or to_update)
+
+    def delete_missing(self):
+        """Удалить позиции, которых больше нет в прайсе, и вернуть их число"""
+        missing_ids = [stored[0] for product_id, stored in self.stored.items() if product_id not in self.seen]
+        for ids_chunk in chunked(missing_ids, QUERY_CHUNK_SIZE):
+            self.delete_product_infos(ProductInfo.objects.filter(id__in=ids_chunk))
+        self.deleted += len(missing_ids)
+        return len(missing_ids)
+
+    @staticmethod
+    def delete_product_infos(product_infos):
+        """Удалить позиции вместе со строками корзин и вернуть число удалённых позиций.
+
+        Оформленные заказы хранят снимок позиции.
+        """
+        OrderItem.objects.filter(product_info__in=product_infos, order__state=OrderStateChoices.BASKET).delete()
+        return product_infos.delete()[1].get(ProductInfo._meta.label, 0)
+
+    def create_parameters(self, product_infos, goods):
+        ProductParameter.objects.bulk_create(
+            [ProductParameter(product_info_id=product_info.id, parameter_id=self.parameters[key], value=value)
+             for product_info, item in zip(product_infos, goods)
+             for key, value in item['parameters'].items()],
+            batch_size=self.batch_size)
+
+    def create_product_infos(self, shop, product_infos):
+        """Создать позиции прайса и проставить им id"""
+        if connection.features.can_return_rows_from_bulk_insert:
+            ProductInfo.objects.bulk_create(product_infos, batch_size=self.batch_size)
+            return
+
+        # Бэкенд не возвращает id из bulk_create: новые позиции магазина
+        # получают id больше уже существующих и идут подряд в порядке вставки
+        last_id = ProductInfo.objects.filter(shop_id=shop.id).order_by('-id').values_list('id', flat=True).first()
+        ProductInfo.objects.bulk_create(product_infos, batch_size=self.batch_size)
+        created_ids = ProductInfo.objects.filter(shop_id=shop.id, id__gt=last_id or 0).order_by('id').values_list(
+            'id', flat=True)
+        for product_info, product_info_id in zip(product_infos, created_ids):
+            product_info.id = product_info_id
+
+    def resolve_names(self, model, names, cache):
+        """Вернуть {название: id}, создав недостающие записи одним bulk_create.
+
+        Названия уникальны, поэтому записи, параллельно созданные другим
+        импортом, пропускаются при вставке и подхватываются повторной выборкой.
+        """
+        missing = {name for name in names if name not in cache}
+        if missing:
+            self.fetch_ids(model, missing, cache)
+            new_names = [name for name in missing if name not in cache]
+            if new_names:
+                model.objects.bulk_create([model(name=name) for name in sorted(new_names)],
+                                          batch_size=self.batch_size, ignore_conflicts=True)
+                self.names_created += len(new_names)
+                self.fetch_ids(model, new_names, cache)
+        return {name: cache[name] for name in names}
+
+    @staticmethod
+    def fetch_ids(model, names, cache):
+        for names_chunk in chunked(names, QUERY_CHUNK_SIZE):
+            for name, object_id in model.objects.filter(name__in=names_chunk).values_list('name', 'id'):
+                cache[name] = object_id
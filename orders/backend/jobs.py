@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+import yaml
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.fetch import fetch_price_list
+from backend.importer import ImportResult, PriceListImporter, read_price_list
+from backend.models import ImportJob, ImportJobStatusChoices, ImportModeChoices, Shop
+
+
+logger = logging.getLogger(__name__)
+
+# Прогресс задачи записывается в ImportJob раз в столько пачек товаров
+PROGRESS_EVERY = 5
+
+_executor = None
+_progress_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Локальный пул потоков для задач импорта (создаётся при первом обращении)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMPORT_JOB_WORKERS', 2),
+                                           thread_name_prefix='price-import')
+        return _executor
+
+
+def wait_for_jobs():
+    """Дождаться задач импорта, запущенных этим процессом, и остановить его пул"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def get_progress_executor():
+    """Поток для записи прогресса задач: у него своё соединение с базой"""
+    global _progress_executor
+    with _executor_lock:
+        if _progress_executor is None:
+            _progress_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-import-progress')
+        return _progress_executor
+
+
+def enqueue_import(user_id, url, mode=ImportModeChoices.DIFF):
+    """Создать задачу импорта и поставить её в очередь после коммита"""
+    job = ImportJob.objects.create(user_id=user_id, url=url, mode=mode)
+    transaction.on_commit(lambda: get_executor().submit(run_import_job, job.id))
+    return job
+
+
+def save_progress(job_id, rows, progress):
+    """Записать прогресс выполняющейся задачи и отметку о том, что она жива.
+
+    Импорт идёт в одной транзакции, поэтому запись делается из отдельного
+    потока со своим соединением: так её сразу видят все процессы. SQLite
+    допускает одного писателя, и там прогресс виден только по завершении.
+    """
+    if connection.vendor == 'sqlite':
+        return
+
+    def write():
+        close_old_connections()
+        try:
+            ImportJob.objects.filter(id=job_id, status=ImportJobStatusChoices.RUNNING).update(
+                rows=rows, progress=progress, heartbeat_at=timezone.now())
+        except DatabaseError:
+            logger.warning('Не удалось записать прогресс задачи импорта %s', job_id, exc_info=True)
+
+    get_progress_executor().submit(write).result()
+
+
+def stale_jobs():
+    """Задачи в очереди или в работе без отметок дольше IMPORT_JOB_STALE_AFTER секунд"""
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'IMPORT_JOB_STALE_AFTER', 900))
+    return ImportJob.objects.filter(
+        Q(heartbeat_at__lt=stale)
+        | Q(heartbeat_at__isnull=True, started_at__lt=stale)
+        | Q(heartbeat_at__isnull=True, started_at__isnull=True, created_at__lt=stale),
+        status__in=[ImportJobStatusChoices.PENDING, ImportJobStatusChoices.RUNNING])
+
+
+def recover_import_jobs():
+    """Подобрать задачи, брошенные остановленными или перезапущенными процессами.
+
+    Задачи из очереди ставятся в очередь этого процесса заново (запустит их
+    только один процесс, см. run_import_job). Прерванный импорт откатился
+    вместе со своей транзакцией, такие задачи завершаются ошибкой.
+    Вызывается командой recover_import_jobs; возвращает число завершённых
+    с ошибкой задач и id поставленных в очередь.
+
+    В SQLite отметки выполнения не пишутся (см. save_progress), и долгий
+    импорт не отличить от брошенного, поэтому там выполняющиеся задачи
+    не трогаются.
+    """
+    now = timezone.now()
+    failed = 0
+    if connection.vendor != 'sqlite':
+        failed = stale_jobs().filter(status=ImportJobStatusChoices.RUNNING).update(
+            status=ImportJobStatusChoices.FAILED, error='Импорт прерван перезапуском сервера', finished_at=now)
+    pending = stale_jobs().filter(status=ImportJobStatusChoices.PENDING)
+    job_ids = list(pending.values_list('id', flat=True))
+    ImportJob.objects.filter(id__in=job_ids).update(heartbeat_at=now)
+    for job_id in job_ids:
+        get_executor().submit(run_import_job, job_id)
+    if failed or job_ids:
+        logger.warning('Брошенные задачи импорта: завершено с ошибкой %s, поставлено в очередь заново %s',
+                       failed, len(job_ids))
+    return failed, job_ids
+
+
+def run_import_job(job_id, source=None):
+    """Выполнить задачу импорта в рабочем потоке.
+
+    source(job) загружает и импортирует прайс; по умолчанию он скачивается по URL задачи.
+    Задача запускается, только если она ещё в очереди: после восстановления
+    брошенных задач её могли поставить в очередь два процесса.
+    """
+    close_old_connections()
+    try:
+        claimed = ImportJob.objects.filter(id=job_id, status=ImportJobStatusChoices.PENDING).update(
+            status=ImportJobStatusChoices.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now())
+        if not claimed:
+            return
+        job = ImportJob.objects.get(id=job_id)
+        started = time.perf_counter()
+        try:
+            result = (source or import_from_url)(job)
+        except (requests.RequestException, yaml.YAMLError, ValueError, KeyError, TypeError) as error:
+            logger.warning('Задача импорта %s завершилась с ошибкой: %s', job.id, error)
+            ImportJob.objects.filter(id=job.id).update(status=ImportJobStatusChoices.FAILED, error=str(error),
+                                                       duration=time.perf_counter() - started,
+                                                       finished_at=timezone.now())
+        else:
+            ImportJob.objects.filter(id=job.id).update(status=ImportJobStatusChoices.DONE, shop=result.shop,
+                                                       rows=result.rows, created=result.created,
+                                                       updated=result.updated, deleted=result.deleted,
+                                                       unchanged=result.unchanged,
+                                                       progress=100, duration=result.duration,
+                                                       finished_at=timezone.now())
+    except Exception:
+        logger.exception('Сбой задачи импорта %s', job_id)
+        ImportJob.objects.filter(id=job_id).update(status=ImportJobStatusChoices.FAILED,
+                                                   error='Внутренняя ошибка импорта', finished_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def get_job_shop(job):
+    """Магазин, прайс которого уже импортировался с URL задачи"""
+    return Shop.objects.filter(user_id=job.user_id, url=job.url).first()
+
+
+def is_resync(job):
+    """Режим replace - явная полная пересинхронизация: прайс скачивается и импортируется, даже если не менялся"""
+    return job.mode == ImportModeChoices.REPLACE
+
+
+def import_from_url(job):
+    shop = get_job_shop(job)
+    with fetch_price_list(job.url, None if is_resync(job) else shop) as download:
+        return import_download(job, download, shop)
+
+
+def import_download(job, download, shop=None):
+    """Импортировать скачанный прайс-лист, если он изменился с прошлого импорта, и запомнить его валидаторы"""
+    started = time.perf_counter()
+    if not is_resync(job) and download.is_unchanged(shop):
+        if not download.not_modified:
+            Shop.objects.filter(id=shop.id).update(**download.validators())
+        logger.info('Прайс магазина %s не изменился, импорт пропущен', shop.name)
+        return ImportResult(shop, 0, time.perf_counter() - started, unchanged=True)
+
+    batches = 0
+
+    def progress(rows):
+        nonlocal batches
+        batches += 1
+        if batches % PROGRESS_EVERY == 0:
+            percent = min(99, download.stream.tell() * 100 // download.size) if download.size else 0
+            save_progress(job.id, rows, percent)
+
+    importer = PriceListImporter(user_id=job.user_id, url=job.url, mode=job.mode)
+    # новые названия создаются первым проходом по прайсу, вне долгой транзакции импорта
+    importer.prepare_names(read_price_list(download.stream))
+    download.stream.seek(0)
+    result = importer.run(read_price_list(download.stream), progress=progress)
+    Shop.objects.filter(id=result.shop.id).update(**download.validators())
+    return result
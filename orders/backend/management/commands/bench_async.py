@@ -0,0 +1,200 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from backend.async_views import wait_for_downloads
+from backend.models import Category, ImportJob, ImportJobStatusChoices, Product, Shop, User, UserTypeChoices
+
+
+def supplier_handler(delay):
+    """Медленный поставщик: отвечает через delay секунд маленьким прайсом, магазин - последняя часть пути"""
+
+    class SupplierHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            name = self.path.strip('/')
+            body = (f'shop: {name}\ncategories:\n  - id: 1\n    name: {name}\n'
+                    f'goods:\n  - id: 1\n    category: 1\n    model: m\n    name: {name}-product\n'
+                    f'    price: 100\n    price_rrc: 120\n    quantity: 5\n    parameters:\n      Цвет: белый\n')
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-yaml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return SupplierHandler
+
+
+def call_wsgi(application, method, path, token, body=b''):
+    """Выполнить запрос к WSGI-приложению в текущем потоке, вернуть код и тело ответа"""
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)), 'HTTP_AUTHORIZATION': f'Token {token}',
+        'wsgi.input': BytesIO(body), 'wsgi.errors': BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0),
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    status = []
+    response = application(environ, lambda response_status, headers, exc_info=None: status.append(response_status))
+    try:
+        content = b''.join(response)
+    finally:
+        response.close()
+    return int(status[0].split()[0]), content
+
+
+async def call_asgi(application, method, path, token, body=b''):
+    """Выполнить запрос к ASGI-приложению в текущем цикле событий, вернуть код и тело ответа"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    finished = asyncio.Event()
+    status, content = [], []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        else:
+            content.append(message.get('body', b''))
+            if not message.get('more_body'):
+                finished.set()
+
+    await application(scope, receive, send)
+    return status[0], b''.join(content)
+
+
+class Command(BaseCommand):
+    help = 'Сравнение WSGI и ASGI на запросах, ждущих медленного поставщика (или на чтении каталога)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=['update', 'catalog'], default='update',
+                            help='update - обновление прайса с медленного поставщика, catalog - чтение каталога')
+        parser.add_argument('--requests', type=int, default=40, help='Число запросов')
+        parser.add_argument('--workers', type=int, default=4, help='Число потоков WSGI-сервера')
+        parser.add_argument('--delay', type=float, default=0.5, help='Задержка ответа поставщика, с')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and options['scenario'] == 'update':
+            self.stderr.write('SQLite допускает только одного писателя: параллельные импорты будут завершаться '
+                              'ошибкой "database is locked", их число показательно только на PostgreSQL')
+        prefix = f'bench-async-{uuid.uuid4().hex[:8]}'
+        server = ThreadingHTTPServer(('127.0.0.1', 0), supplier_handler(options['delay']))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        supplier = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            if options['scenario'] == 'update':
+                # под WSGI асинхронное представление выполняется через async_to_sync и держит
+                # поток сервера всё время ожидания поставщика - как прежнее синхронное
+                wsgi_requests, asgi_requests = (
+                    [('POST', '/api/v1/async/partner/update/', token,
+                      json.dumps({'url': f'{supplier}/{name}', 'mode': 'replace'}).encode())
+                     for name, token in self.create_users(f'{prefix}-{server_name}', options['requests'])]
+                    for server_name in ('wsgi', 'asgi'))
+            else:
+                tokens = [token for _, token in self.create_users(prefix, options['requests'])]
+                wsgi_requests = [('GET', '/api/v1/products/?limit=20', token, b'') for token in tokens]
+                asgi_requests = [('GET', '/api/v1/async/products/?limit=20', token, b'') for token in tokens]
+
+            self.report('WSGI', options, *self.run_wsgi(wsgi_requests, options['workers']))
+            self.report('ASGI', options, *asyncio.run(self.run_asgi(asgi_requests)))
+        finally:
+            self.wait_for_jobs(prefix)
+            server.shutdown()
+            server.server_close()
+            self.delete_data(prefix)
+
+    @staticmethod
+    def create_users(prefix, count):
+        tokens = []
+        for number in range(count):
+            user = User.objects.create(username=f'{prefix}-{number}', email=f'{prefix}-{number}@example.com',
+                                       type=UserTypeChoices.SHOP)
+            tokens.append((user.username, Token.objects.create(user=user).key))
+        return tokens
+
+    @staticmethod
+    def run_wsgi(requests, workers):
+        application = get_wsgi_application()
+
+        def call(request):
+            started = time.perf_counter()
+            response = call_wsgi(application, *request)
+            return response, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(call, requests))
+        return results, time.perf_counter() - started
+
+    @staticmethod
+    async def run_asgi(requests):
+        application = get_asgi_application()
+
+        async def call(request):
+            started = time.perf_counter()
+            response = await call_asgi(application, *request)
+            return response, time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*map(call, requests))
+        duration = time.perf_counter() - started
+        # представление отвечает до загрузки прайса, а asyncio.run() отменит незавершённые загрузки
+        await wait_for_downloads()
+        return results, duration
+
+    def report(self, server_name, options, results, duration):
+        succeeded = sum(status in (200, 202) and (options['scenario'] == 'catalog' or json.loads(content)['Status'])
+                        for (status, content), _ in results)
+        latencies = sorted(latency * 1000 for _, latency in results)
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        workers = f"потоков: {options['workers']}" if server_name == 'WSGI' else 'один цикл событий'
+        self.stdout.write(
+            f"{server_name} ({workers}): запросов {len(results)}, успешных {succeeded}, "
+            f"время {duration:.2f} с, {len(results) / duration:.1f} запросов/с, "
+            f"задержка, мс: p50 {percentiles[49]:.1f}, p95 {percentiles[94]:.1f}, p99 {percentiles[98]:.1f}")
+
+    @staticmethod
+    def wait_for_jobs(prefix, timeout=300):
+        """Дождаться фоновых импортов: представление отвечает, не дожидаясь их"""
+        jobs = ImportJob.objects.filter(user__username__startswith=prefix, status__in=[
+            ImportJobStatusChoices.PENDING, ImportJobStatusChoices.RUNNING])
+        deadline = time.monotonic() + timeout
+        while jobs.exists() and time.monotonic() < deadline:
+            time.sleep(0.2)
+
+    @staticmethod
+    def delete_data(prefix):
+        ImportJob.objects.filter(user__username__startswith=prefix).delete()
+        Shop.objects.filter(name__startswith=prefix).delete()
+        Product.objects.filter(name__startswith=prefix).delete()
+        Category.objects.filter(name__startswith=prefix).delete()
+        User.objects.filter(username__startswith=prefix).delete()
@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from backend.checkout import CheckoutError, InsufficientStock, checkout_basket
+from backend.models import Buyer, Category, Order, OrderItem, Product, ProductInfo, Shop, User, UserTypeChoices
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка оформления заказов: параллельные покупатели разбирают общие товары'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200, help='Число покупателей (корзин)')
+        parser.add_argument('--workers', type=int, default=16, help='Число параллельных потоков')
+        parser.add_argument('--skus', type=int, default=5, help='Число «горячих» позиций')
+        parser.add_argument('--stock', type=int, default=100, help='Остаток каждой позиции')
+        parser.add_argument('--lines', type=int, default=3, help='Позиций в корзине')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stderr.write('SQLite не поддерживает SELECT ... FOR UPDATE: конкурирующие оформления будут '
+                              'завершаться ошибкой "database is locked", результаты показательны только на PostgreSQL')
+        prefix = f'bench-checkout-{uuid.uuid4().hex[:8]}'
+        baskets, offer_ids = self.create_data(prefix, options)
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(self.checkout, baskets))
+            duration = time.perf_counter() - started
+            self.report(results, duration, offer_ids, options)
+        finally:
+            if not options['keep']:
+                self.delete_data(prefix)
+
+    def create_data(self, prefix, options):
+        shop_user = User.objects.create(username=f'{prefix}-shop', email=f'{prefix}-shop@example.com',
+                                        type=UserTypeChoices.SHOP)
+        shop = Shop.objects.create(name=prefix, user=shop_user)
+        category = Category.objects.create(name=prefix)
+        offers = []
+        for number in range(options['skus']):
+            product = Product.objects.create(name=f'{prefix}-{number}', category=category)
+            offers.append(ProductInfo.objects.create(product=product, shop=shop, price=100, quantity=options['stock']))
+
+        rng = random.Random(options['seed'])
+        baskets = []
+        for number in range(options['buyers']):
+            user = User.objects.create(username=f'{prefix}-{number}', email=f'{prefix}-{number}@example.com')
+            buyer = Buyer.objects.create(user=user, name=user.username, address='-', phone='-')
+            order = Order.objects.create(user=user)
+            lines = rng.sample(offers, min(options['lines'], len(offers)))
+            OrderItem.objects.bulk_create([OrderItem(order=order, product_info=offer, quantity=rng.randint(1, 3))
+                                           for offer in lines])
+            baskets.append((user.id, order.id, buyer.id))
+        return baskets, [offer.id for offer in offers]
+
+    @staticmethod
+    def checkout(basket):
+        started = time.perf_counter()
+        try:
+            checkout_basket(*basket)
+            outcome = 'ok'
+        except InsufficientStock:
+            outcome = 'insufficient'
+        except (CheckoutError, DatabaseError):
+            outcome = 'error'
+        finally:
+            connection.close()
+        return outcome, time.perf_counter() - started
+
+    def report(self, results, duration, offer_ids, options):
+        outcomes = [outcome for outcome, _ in results]
+        latencies = sorted(latency * 1000 for _, latency in results)
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+
+        stock = dict(ProductInfo.objects.filter(id__in=offer_ids).values_list('id', 'quantity'))
+        sold = OrderItem.objects.filter(product_info_id__in=offer_ids, order__state='new').values_list(
+            'product_info_id', 'quantity')
+        sold_by_offer = dict.fromkeys(offer_ids, 0)
+        for product_info_id, quantity in sold:
+            sold_by_offer[product_info_id] += quantity
+        mismatched = [offer_id for offer_id in offer_ids
+                      if stock[offer_id] != options['stock'] - sold_by_offer[offer_id]]
+
+        self.stdout.write(
+            f"Заказов: {len(results)}, потоков: {options['workers']}, позиций: {options['skus']}, "
+            f"остаток: {options['stock']}\n"
+            f"Оформлено: {outcomes.count('ok')}, не хватило товара: {outcomes.count('insufficient')}, "
+            f"ошибок: {outcomes.count('error')}\n"
+            f"Время: {duration:.2f} с, {len(results) / duration:.1f} заказов/с\n"
+            f"Задержка, мс: p50 {percentiles[49]:.1f}, p95 {percentiles[94]:.1f}, p99 {percentiles[98]:.1f}")
+        if mismatched:
+            self.stdout.write(self.style.ERROR(f'Остатки не сходятся с проданным по позициям: {mismatched}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Остатки сходятся с проданным, перепродаж нет'))
+
+    @staticmethod
+    def delete_data(prefix):
+        User.objects.filter(username__startswith=prefix).delete()
+        Product.objects.filter(name__startswith=prefix).delete()
+        Category.objects.filter(name=prefix).delete()
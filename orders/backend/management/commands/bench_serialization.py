@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from backend.models import Product, ProductInfo, ShopOrder
+from backend.rendering import FastJSONRenderer
+from backend.serialaizers import PRODUCT_INFO_ROW, PRODUCT_ROW, SHOP_ORDER_ROW, ProductInfoSerializer, \
+    ProductSerializer, ShopOrderSerializer
+
+
+def benchmarks():
+    """(название, queryset, сериализатор, RowMapper) для сравниваемых списков"""
+    return [
+        ('products (ProductInfoView)', ProductInfo.objects.select_related('shop', 'product__category').order_by('id'),
+         ProductInfoSerializer, PRODUCT_INFO_ROW),
+        ('product (ProductView)', Product.objects.select_related('category').order_by('id'),
+         ProductSerializer, PRODUCT_ROW),
+        ('partner/orders (ShopOrdersView)', ShopOrder.objects.order_by('-id'),
+         ShopOrderSerializer, SHOP_ORDER_ROW),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Сравнение вывода списков через ModelSerializer и через values_list() + RowMapper'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Строк на странице')
+        parser.add_argument('--repeat', type=int, default=20, help='Число повторов')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        for name, queryset, serializer_class, row_mapper in benchmarks():
+            def serializer_path():
+                return JSONRenderer().render(serializer_class(list(queryset[:rows]), many=True).data)
+
+            def fast_path():
+                page = queryset.values_list(*row_mapper.fields, named=True)[:rows]
+                return FastJSONRenderer().render(row_mapper.map_rows(page))
+
+            if serializer_path() != fast_path():
+                raise CommandError(f'{name}: вывод быстрого пути отличается от сериализатора')
+            count = len(queryset[:rows])
+            if not count:
+                self.stdout.write(f'{name}: нет данных')
+                continue
+
+            slow, fast = self.measure(serializer_path, repeat), self.measure(fast_path, repeat)
+            self.stdout.write(f'{name}, строк: {count}: сериализатор {slow * 1000:.2f} мс, '
+                              f'быстрый путь {fast * 1000:.2f} мс, ускорение x{slow / fast:.1f}')
+
+    @staticmethod
+    def measure(function, repeat):
+        """Лучшее время одного вызова из repeat"""
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - started)
+        return best
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from backend.models import Category, Order, OrderItem, OrderStateChoices, Parameter, Product, ProductInfo, Shop, \
+    ShopStatusChoices
+
+
+# Признаки использования индекса в плане запроса
+INDEX_MARKERS = {
+    'sqlite': ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY', 'USING PRIMARY KEY'),
+    'postgresql': ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan'),
+}
+
+
+def hot_queries():
+    """Запросы горячих путей: корзина, заказы, импорт и каталог"""
+    return [
+        ('Корзина пользователя', Order.objects.filter(user_id=1, state=OrderStateChoices.BASKET)),
+        ('История заказов', Order.objects.filter(user_id=1).exclude(state=OrderStateChoices.BASKET)),
+        ('Позиция корзины', OrderItem.objects.filter(order_id=1, product_info_id=1)),
+        ('Позиция магазина', ProductInfo.objects.filter(shop_id=1, product_id=1)),
+        ('Открытые магазины', Shop.objects.filter(state=ShopStatusChoices.OPEN)),
+        ('Товар по названию', Product.objects.filter(name='')),
+        ('Категория по названию', Category.objects.filter(name='')),
+        ('Параметр по названию', Parameter.objects.filter(name='')),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Проверка, что запросы горячих путей используют индексы (EXPLAIN)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plan', action='store_true', help='Печатать полный план каждого запроса')
+
+    def handle(self, *args, **options):
+        markers = INDEX_MARKERS.get(connection.vendor)
+        if markers is None:
+            raise CommandError(f'Проверка планов не поддерживается для {connection.vendor}')
+
+        failed = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # На маленьких таблицах планировщик предпочитает Seq Scan,
+                # поэтому проверяем, что индекс вообще может быть использован
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in hot_queries():
+                plan = queryset.explain()
+                uses_index = any(marker in plan for marker in markers)
+                if not uses_index:
+                    failed.append(name)
+                status = self.style.SUCCESS('OK  ') if uses_index else self.style.ERROR('FAIL')
+                self.stdout.write(f'{status} {name}')
+                if options['verbose_plan'] or not uses_index:
+                    self.stdout.write('\n'.join(f'     {line}' for line in plan.splitlines()))
+
+        if failed:
+            raise CommandError(f'Без индекса: {", ".join(failed)}')
@@ -0,0 +1,158 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.authtoken.models import Token
+
+from backend.cache import shop_changed
+from backend.checkout import build_shop_orders
+from backend.importer import parameters_document, parameters_fingerprint
+from backend.models import Buyer, Category, Order, OrderItem, OrderStateChoices, Parameter, Product, ProductInfo, \
+    ProductParameter, Shop, ShopOrder, User, UserTypeChoices
+from backend.search import build_search_text
+
+
+WORDS = ['смартфон', 'чехол', 'кабель', 'наушники', 'зарядка', 'планшет', 'часы', 'колонка', 'ноутбук', 'мышь']
+ORDER_STATES = [OrderStateChoices.NEW, OrderStateChoices.CONFIRMED, OrderStateChoices.ASSEMBLED,
+                OrderStateChoices.SENT, OrderStateChoices.DELIVERED]
+
+
+def bulk_create(model, objects, batch_size):
+    """bulk_create с проставлением id и на бэкендах, которые их не возвращают (SQLite).
+
+    Рассчитан на генерацию данных без параллельных вставок в те же таблицы.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects, batch_size=batch_size)
+    last_id = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    created_ids = model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)
+    for obj, obj_id in zip(objects, created_ids):
+        obj.id = obj_id
+    return objects
+
+
+class Command(BaseCommand):
+    help = 'Быстрая генерация тестовых данных: магазины, товары, параметры, покупатели и заказы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=10, help='Число магазинов')
+        parser.add_argument('--products', type=int, default=1000, help='Число товаров (каждый есть во всех магазинах)')
+        parser.add_argument('--parameters', type=int, default=5, help='Параметров у каждого товара')
+        parser.add_argument('--categories', type=int, default=10, help='Число категорий')
+        parser.add_argument('--users', type=int, default=100, help='Число покупателей')
+        parser.add_argument('--orders', type=int, default=200, help='Число оформленных заказов')
+        parser.add_argument('--prefix', default='gen', help='Префикс имён создаваемых записей')
+        parser.add_argument('--password', default='password', help='Пароль всех создаваемых пользователей')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Удалить данные с тем же префиксом перед генерацией')
+
+    def handle(self, *args, **options):
+        prefix, batch_size = options['prefix'], options['batch_size']
+        self.rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        if options['clear']:
+            delete_data(prefix)
+
+        with transaction.atomic():
+            password = make_password(options['password'])
+            shop_users = self.create_users(f'{prefix}-shop', options['shops'], UserTypeChoices.SHOP, password,
+                                           batch_size)
+            buyer_users = self.create_users(f'{prefix}-buyer', options['users'], UserTypeChoices.BUYER, password,
+                                            batch_size)
+            shops = bulk_create(Shop, [Shop(name=f'{prefix} shop {number}', user_id=user.id)
+                                       for number, user in enumerate(shop_users)], batch_size)
+            categories = bulk_create(Category, [Category(name=f'{prefix} category {number}')
+                                                for number in range(options['categories'])], batch_size)
+            Category.shops.through.objects.bulk_create(
+                [Category.shops.through(category_id=category.id, shop_id=shop.id)
+                 for category in categories for shop in shops], batch_size=batch_size)
+            products = bulk_create(Product, [
+                Product(name=f'{prefix} {self.rng.choice(WORDS)} {number}', category_id=self.rng.choice(categories).id)
+                for number in range(options['products'])], batch_size)
+            parameters = bulk_create(Parameter, [Parameter(name=f'{prefix} parameter {number}')
+                                                 for number in range(options['parameters'])], batch_size)
+
+            offers = 0
+            for shop in shops:
+                offers += self.create_offers(shop, products, parameters, batch_size)
+            buyers = bulk_create(Buyer, [Buyer(user_id=user.id, name=user.username, address=f'Адрес {user.username}',
+                                               phone='+70000000000') for user in buyer_users], batch_size)
+            self.create_orders(shops, buyers, options['orders'], batch_size)
+            shop_changed(id__in=[shop.id for shop in shops])
+
+        duration = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: магазинов {len(shops)}, товаров {len(products)}, позиций {offers}, "
+            f"параметров позиций {offers * len(parameters)}, покупателей {len(buyers)}, заказов {options['orders']} "
+            f"за {duration:.2f} с"))
+
+    @staticmethod
+    def create_users(prefix, count, user_type, password, batch_size):
+        users = bulk_create(User, [User(username=f'{prefix}-{number}', email=f'{prefix}-{number}@example.com',
+                                        type=user_type, password=password) for number in range(count)], batch_size)
+        Token.objects.bulk_create([Token(key=Token.generate_key(), user_id=user.id) for user in users],
+                                  batch_size=batch_size)
+        return users
+
+    def create_offers(self, shop, products, parameters, batch_size):
+        """Позиции магазина по всем товарам и их параметры; значения параметров - из небольшого набора для фасетов"""
+        product_infos, values = [], []
+        for product in products:
+            item_parameters = {parameter.name: f'v{self.rng.randrange(5)}' for parameter in parameters}
+            product_infos.append(ProductInfo(
+                product_id=product.id, shop_id=shop.id, price=self.rng.randrange(100, 10000),
+                quantity=self.rng.randrange(100, 1000), fingerprint=parameters_fingerprint(item_parameters),
+                search_text=build_search_text(product.name, item_parameters),
+                parameters=parameters_document(item_parameters)))
+            values.append(item_parameters)
+        bulk_create(ProductInfo, product_infos, batch_size)
+        ProductParameter.objects.bulk_create(
+            [ProductParameter(product_info_id=product_info.id, parameter_id=parameter.id,
+                              value=item_parameters[parameter.name])
+             for product_info, item_parameters in zip(product_infos, values) for parameter in parameters],
+            batch_size=batch_size)
+        return len(product_infos)
+
+    def create_orders(self, shops, buyers, count, batch_size):
+        """Оформленные заказы со снимком цен и проекцией по магазинам, как после checkout_basket"""
+        if not buyers or not count:
+            return
+        shop_names = {shop.id: shop.name for shop in shops}
+        offers = list(ProductInfo.objects.filter(shop_id__in=shop_names).values_list(
+            'id', 'shop_id', 'price', 'product__name'))
+        orders, lines = [], []
+        for _ in range(count):
+            buyer = self.rng.choice(buyers)
+            orders.append(Order(user_id=buyer.user_id, buyer_id=buyer.id, state=self.rng.choice(ORDER_STATES)))
+            lines.append([OrderItem(product_info_id=offer_id, quantity=self.rng.randint(1, 3), price=price,
+                                    product_name=product_name, shop_id=shop_id, shop_name=shop_names[shop_id])
+                          for offer_id, shop_id, price, product_name in self.rng.sample(
+                              offers, min(len(offers), self.rng.randint(1, 5)))])
+        for order, items in zip(orders, lines):
+            order.total_price = sum(item.price * item.quantity for item in items)
+        bulk_create(Order, orders, batch_size)
+
+        for order, items in zip(orders, lines):
+            for item in items:
+                item.order_id = order.id
+        bulk_create(OrderItem, [item for items in lines for item in items], batch_size)
+
+        buyers_by_id = {buyer.id: buyer for buyer in buyers}
+        shop_orders = []
+        for order, items in zip(orders, lines):
+            buyer = buyers_by_id[order.buyer_id]
+            shop_orders.extend(build_shop_orders(order, {'id': buyer.id, 'name': buyer.name, 'address': buyer.address,
+                                                         'phone': buyer.phone, 'user': buyer.user_id}, items))
+        ShopOrder.objects.bulk_create(shop_orders, batch_size=batch_size)
+
+
+def delete_data(prefix):
+    """Удалить данные, созданные с префиксом prefix"""
+    User.objects.filter(username__startswith=f'{prefix}-').delete()
+    Product.objects.filter(name__startswith=f'{prefix} ').delete()
+    Category.objects.filter(name__startswith=f'{prefix} ').delete()
+    Parameter.objects.filter(name__startswith=f'{prefix} ').delete()
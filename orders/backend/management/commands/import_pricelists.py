@@ -0,0 +1,149 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+
+
+def init_worker():
+    """Подготовить Django в дочернем процессе пула"""
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def file_hash(path):
+    """SHA-256 содержимого файла, как его считает PriceListDownload"""
+    content_hash = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(64 * 1024), b''):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def import_file(path, mode, batch_size, user_id=None, url=None):
+    """Импортировать один прайс-лист в дочернем процессе"""
+    import yaml
+    from backend.importer import PriceListImporter, read_price_list
+    from backend.models import Shop
+
+    try:
+        with open(path, 'rb') as stream:
+            importer = PriceListImporter(user_id=user_id, url=url, batch_size=batch_size, mode=mode, atomic=False)
+            result = importer.run(read_price_list(stream))
+        if user_id is not None:
+            # позиции магазина теперь из файла: следующая загрузка по ссылке сравнивается с ним
+            Shop.objects.filter(id=result.shop.id).update(price_etag='', price_last_modified='',
+                                                          price_hash=file_hash(path))
+        return {'file': str(path), **result.as_dict()}
+    except (OSError, DatabaseError, yaml.YAMLError, ValueError, KeyError, TypeError) as error:
+        return {'file': str(path), 'error': str(error)}
+    finally:
+        connections.close_all()
+
+
+def import_files(paths, mode, batch_size, user_id=None, url=None):
+    """Импортировать прайс-листы одного магазина по очереди в дочернем процессе"""
+    return [import_file(path, mode, batch_size, user_id, url) for path in paths]
+
+
+class Command(BaseCommand):
+    help = 'Параллельный импорт YAML прайс-листов поставщиков из файлов или каталогов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы прайс-листов или каталоги с *.yaml/*.yml')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Число процессов')
+        parser.add_argument('--mode', choices=['diff', 'replace'], default='diff', help='Режим импорта')
+        parser.add_argument('--batch-size', type=int, default=None, help='Размер пачки товаров')
+        parser.add_argument('--user', default=None,
+                            help='Логин поставщика: прайсы загружаются в его магазин, как через API')
+        parser.add_argument('--url', default=None,
+                            help='Ссылка на прайс магазина (по умолчанию - сохранённая у магазина поставщика)')
+
+    def handle(self, *args, **options):
+        files = self.collect_files(options['paths'])
+        if not files:
+            raise CommandError('Не найдено ни одного прайс-листа')
+        user_id, url = self.resolve_owner(options['user'], options['url'])
+        if user_id is not None and len(files) > 1:
+            raise CommandError('С --user загружается один прайс-лист: все файлы попали бы в один магазин')
+        # прайсы одного магазина импортируются по очереди в одном процессе,
+        # чтобы они не создавали магазин и не удаляли позиции друг друга параллельно
+        groups = self.group_by_shop(files)
+
+        workers = min(options['workers'], len(groups))
+        if connection.vendor == 'sqlite' and workers > 1:
+            self.stderr.write('SQLite допускает только одного писателя, импорт пойдёт в один процесс')
+            workers = 1
+
+        # дочерние процессы не должны наследовать открытые соединения
+        connections.close_all()
+        started = time.perf_counter()
+        rows = failed = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            futures = [pool.submit(import_files, paths, options['mode'], options['batch_size'], user_id, url)
+                       for paths in groups]
+            for future in as_completed(futures):
+                for result in future.result():
+                    if 'error' in result:
+                        failed += 1
+                        self.stderr.write(f"{result['file']}: ошибка: {result['error']}")
+                        continue
+                    rows += result['rows']
+                    self.stdout.write(f"{result['file']}: {result['shop']} - {result['rows']} позиций "
+                                      f"(создано {result['created']}, обновлено {result['updated']}, "
+                                      f"удалено {result['deleted']}) за {result['duration']} с")
+
+        duration = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано файлов: {len(files) - failed} из {len(files)}, позиций: {rows} '
+            f'за {duration:.2f} с ({rows / duration if duration else rows:.1f} строк/с)'))
+
+    @staticmethod
+    def resolve_owner(username, url):
+        """id поставщика и ссылка, с которыми его магазин найдёт импорт через API"""
+        from backend.models import Shop, User, UserTypeChoices
+
+        if username is None:
+            if url:
+                raise CommandError('--url задаётся только вместе с --user')
+            return None, None
+        user = User.objects.filter(username=username, type=UserTypeChoices.SHOP).first()
+        if user is None:
+            raise CommandError(f'Поставщик не найден: {username}')
+        if url is None:
+            url = Shop.objects.filter(user_id=user.id).values_list('url', flat=True).first()
+        return user.id, url
+
+    @staticmethod
+    def group_by_shop(files):
+        """Списки файлов по магазинам в порядке файлов; нечитаемый файл - отдельной группой"""
+        import yaml
+        from backend.importer import read_shop_name
+
+        groups = {}
+        for path in files:
+            try:
+                with open(path, 'rb') as stream:
+                    key = read_shop_name(stream)
+            except (OSError, yaml.YAMLError, ValueError, KeyError):
+                key = path  # ошибку покажет импорт этого файла
+            groups.setdefault(key, []).append(path)
+        return list(groups.values())
+
+    @staticmethod
+    def collect_files(paths):
+        files = []
+        for path in map(Path, paths):
+            if path.is_dir():
+                files.extend(sorted(p for p in path.iterdir() if p.suffix in ('.yaml', '.yml')))
+            elif path.is_file():
+                files.append(path)
+            else:
+                raise CommandError(f'Путь не найден: {path}')
+        return files
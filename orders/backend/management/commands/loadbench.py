@@ -0,0 +1,314 @@
+import json
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from backend.management.commands.bench_async import call_wsgi
+from backend.management.commands.generate_data import WORDS
+from backend.models import Buyer, Category, ImportJob, ImportJobStatusChoices, Order, OrderStateChoices, Parameter, \
+    Product, ProductInfo, Shop, User, UserTypeChoices
+
+
+SCENARIOS = ('catalog', 'basket', 'checkout', 'partner', 'import')
+DEFAULT_MIX = 'catalog=60,basket=15,checkout=10,partner=10,import=5'
+
+
+def parse_mix(value):
+    """'catalog=60,basket=15' -> {'catalog': 60, 'basket': 15}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS or not weight.strip().isdigit():
+            raise CommandError(f'Некорректная смесь запросов: {part}')
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+def endpoint_label(method, path):
+    """Имя эндпоинта для отчёта: метод, путь без id и имена параметров запроса"""
+    parts = urlsplit(path)
+    route = '/'.join('<id>' if segment.isdigit() else segment for segment in parts.path.split('/'))
+    params = sorted({name for name, _ in parse_qsl(parts.query)})
+    return f"{method} {route}{'?' + '&'.join(params) if params else ''}"
+
+
+def percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+def price_list_handler(prefix, goods):
+    """Поставщик для сценария import: прайс из goods товаров со случайными ценами, магазин - путь запроса"""
+
+    class PriceListHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            rng = random.Random()
+            lines = [f'shop: {self.path.strip("/")}', 'categories:', '  - id: 1', f'    name: {prefix} import category',
+                     'goods:']
+            for number in range(goods):
+                lines += [f'  - id: {number}', '    category: 1', f'    model: m{number}',
+                          f'    name: {prefix} import {number}', f'    price: {rng.randrange(100, 10000)}',
+                          '    price_rrc: 1', f'    quantity: {rng.randrange(100, 1000)}', '    parameters:',
+                          f'      Цвет: c{number % 7}']
+            body = '\n'.join(lines).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-yaml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return PriceListHandler
+
+
+class QueryCounter:
+    """execute_wrapper, считающий SQL-запросы соединения текущего потока"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон смеси запросов (каталог, корзина, оформление, заказы поставщика, импорт) '
+            'по данным generate_data: задержки p50/p95/p99, пропускная способность и число SQL-запросов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='gen', help='Префикс данных, созданных generate_data')
+        parser.add_argument('--requests', type=int, default=500, help='Число сценариев в прогоне')
+        parser.add_argument('--workers', type=int, default=8, help='Число параллельных клиентов')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Веса сценариев, по умолчанию {DEFAULT_MIX}')
+        parser.add_argument('--import-goods', type=int, default=200, help='Товаров в прайсе сценария import')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для результатов в JSON (по умолчанию loadbench-<время>.json)')
+        parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        prefix = options['prefix']
+        self.load_data(prefix)
+        if connection.vendor == 'sqlite' and options['workers'] > 1:
+            self.stderr.write('SQLite допускает только одного писателя: часть записывающих запросов может '
+                              'завершиться ошибкой "database is locked"')
+
+        rng = random.Random(options['seed'])
+        script = rng.choices(list(mix), weights=list(mix.values()), k=options['requests'])
+        self.application = get_wsgi_application()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), price_list_handler(prefix, options['import_goods']))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.supplier = f'http://127.0.0.1:{server.server_address[1]}'
+        self.importers = self.create_importers(prefix, options['workers'])
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                records = [record for action in pool.map(
+                    self.run_action, script, range(options['seed'], options['seed'] + len(script)))
+                    for record in action]
+            duration = time.perf_counter() - started
+        finally:
+            server.shutdown()
+            server.server_close()
+            self.delete_importers(prefix)
+
+        results = self.summarize(records, duration, script, options)
+        self.report(results)
+        output = Path(options['output'] or f"loadbench-{timezone.now():%Y%m%d-%H%M%S}.json")
+        output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        self.stdout.write(f'Результаты сохранены в {output}')
+        if options['compare']:
+            self.compare(json.loads(Path(options['compare']).read_text(encoding='utf-8')), results)
+
+    def load_data(self, prefix):
+        buyers = list(Buyer.objects.filter(user__username__startswith=f'{prefix}-buyer-').values_list(
+            'user__auth_token__key', 'user_id', 'id'))
+        self.shop_tokens = list(Token.objects.filter(user__username__startswith=f'{prefix}-shop-').values_list(
+            'key', flat=True))
+        self.shop_ids = list(Shop.objects.filter(user__username__startswith=f'{prefix}-shop-').values_list(
+            'id', flat=True))
+        self.offer_ids = list(ProductInfo.objects.filter(shop_id__in=self.shop_ids).values_list('id', flat=True))
+        self.parameters = list(Parameter.objects.filter(name__startswith=f'{prefix} ').values_list('name', flat=True))
+        if not buyers or not self.shop_ids or not self.offer_ids:
+            raise CommandError(f'Нет данных с префиксом {prefix}: сначала выполните generate_data --prefix {prefix}')
+        self.buyer_tokens = [token for token, _, _ in buyers]
+        # покупатель и магазин для импорта в каждый момент заняты одним клиентом
+        self.buyers = queue.Queue()
+        for buyer in buyers:
+            self.buyers.put(buyer)
+
+    @staticmethod
+    def create_importers(prefix, count):
+        importers = queue.Queue()
+        for number in range(count):
+            username = f'{prefix}-import-{number}'
+            user = User.objects.create(username=username, email=f'{username}@example.com', type=UserTypeChoices.SHOP)
+            importers.put((Token.objects.create(user=user).key, user.username))
+        return importers
+
+    @staticmethod
+    def delete_importers(prefix):
+        User.objects.filter(username__startswith=f'{prefix}-import-').delete()
+        Product.objects.filter(name__startswith=f'{prefix} import ').delete()
+        Category.objects.filter(name=f'{prefix} import category').delete()
+
+    def run_action(self, scenario, seed):
+        """Выполнить один сценарий, вернуть записи (эндпоинт, код, задержка, число запросов, ошибка)"""
+        records = []
+        try:
+            getattr(self, f'scenario_{scenario}')(random.Random(seed), records)
+        finally:
+            connection.close()
+        return records
+
+    def request(self, records, method, path, token, data=None):
+        counter = QueryCounter()
+        body = json.dumps(data).encode() if data is not None else b''
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            status, content = call_wsgi(self.application, method, path, token, body)
+        latency = time.perf_counter() - started
+        try:
+            payload = json.loads(content) if content else None
+        except ValueError:
+            payload = None
+        failed = status >= 400 or (isinstance(payload, dict) and payload.get('Status') is False)
+        records.append((endpoint_label(method, path), status, latency, counter.count, failed))
+        return payload
+
+    def scenario_catalog(self, rng, records):
+        token = rng.choice(self.buyer_tokens)
+        path = rng.choice([
+            '/api/v1/categories/',
+            '/api/v1/shops/',
+            '/api/v1/product/',
+            f'/api/v1/products/?shop={rng.choice(self.shop_ids)}',
+            f'/api/v1/products/?q={quote(rng.choice(WORDS))}',
+            f'/api/v1/products/?param={quote(rng.choice(self.parameters or [""]) + ":v0")}&facets=1',
+        ])
+        self.request(records, 'GET', path, token)
+
+    def basket_items(self, rng):
+        return [{'product_info': offer_id, 'quantity': 1} for offer_id in rng.sample(self.offer_ids, rng.randint(1, 3))]
+
+    def scenario_basket(self, rng, records):
+        token, _, _ = buyer = self.buyers.get()
+        try:
+            self.request(records, 'POST', '/api/v1/basket/', token, {'items': self.basket_items(rng)})
+            self.request(records, 'GET', '/api/v1/basket/', token)
+        finally:
+            self.buyers.put(buyer)
+
+    def scenario_checkout(self, rng, records):
+        token, user_id, buyer_id = buyer = self.buyers.get()
+        try:
+            self.request(records, 'POST', '/api/v1/basket/', token, {'items': self.basket_items(rng)})
+            basket_id = Order.objects.filter(user_id=user_id, state=OrderStateChoices.BASKET).values_list(
+                'id', flat=True).first()
+            if basket_id:
+                self.request(records, 'POST', '/api/v1/order/', token, {'id': basket_id, 'buyer': buyer_id})
+            self.request(records, 'GET', '/api/v1/order/', token)
+        finally:
+            self.buyers.put(buyer)
+
+    def scenario_partner(self, rng, records):
+        self.request(records, 'GET', '/api/v1/partner/orders/', rng.choice(self.shop_tokens))
+
+    def scenario_import(self, rng, records):
+        """Поставить импорт прайса в очередь и опрашивать статус задачи до её завершения"""
+        token, name = importer = self.importers.get()
+        try:
+            payload = self.request(records, 'POST', '/api/v1/partner/update/', token,
+                                   {'url': f'{self.supplier}/{name}', 'mode': 'diff'})
+            if not payload or 'job' not in payload:
+                return
+            deadline = time.monotonic() + 120
+            status = None
+            while status not in (ImportJobStatusChoices.DONE, ImportJobStatusChoices.FAILED) \
+                    and time.monotonic() < deadline:
+                time.sleep(0.05)
+                status = (self.request(records, 'GET', f"/api/v1/partner/update/{payload['job']}/", token)
+                          or {}).get('status')
+            job = ImportJob.objects.filter(id=payload['job']).values('created_at', 'finished_at', 'status').first()
+            if job and job['finished_at']:
+                records.append(('import job', 200, (job['finished_at'] - job['created_at']).total_seconds(), None,
+                                job['status'] != ImportJobStatusChoices.DONE))
+        finally:
+            self.importers.put(importer)
+
+    @staticmethod
+    def summarize(records, duration, script, options):
+        by_endpoint = defaultdict(list)
+        for record in records:
+            by_endpoint[record[0]].append(record)
+
+        endpoints = {}
+        for label, items in sorted(by_endpoint.items()):
+            latencies = sorted(latency * 1000 for _, _, latency, _, _ in items)
+            queries = [count for _, _, _, count, _ in items if count is not None]
+            endpoints[label] = {
+                'requests': len(items),
+                'errors': sum(failed for *_, failed in items),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'mean_ms': round(statistics.fmean(latencies), 2),
+                'throughput_rps': round(len(items) / duration, 2),
+                'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+                'queries_max': max(queries) if queries else None,
+            }
+        http_requests = sum(1 for record in records if record[3] is not None)
+        return {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in ('prefix', 'requests', 'workers', 'mix', 'import_goods', 'seed')},
+            'scenarios': {name: script.count(name) for name in SCENARIOS if name in script},
+            'duration_s': round(duration, 3),
+            'http_requests': http_requests,
+            'throughput_rps': round(http_requests / duration, 2),
+            'endpoints': endpoints,
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'Эндпоинт':<48} {'запр.':>6} {'ошиб.':>6} {'p50':>8} {'p95':>8} {'p99':>8} "
+                          f"{'rps':>8} {'SQL':>6}")
+        for label, stats in results['endpoints'].items():
+            queries = '-' if stats['queries_mean'] is None else f"{stats['queries_mean']:.1f}"
+            self.stdout.write(f"{label:<48} {stats['requests']:>6} {stats['errors']:>6} {stats['p50_ms']:>8.1f} "
+                              f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['throughput_rps']:>8.1f} "
+                              f"{queries:>6}")
+        self.stdout.write(self.style.SUCCESS(
+            f"HTTP-запросов: {results['http_requests']} за {results['duration_s']} с, "
+            f"{results['throughput_rps']} запросов/с ({results['database']}, "
+            f"клиентов: {results['options']['workers']})"))
+
+    def compare(self, previous, current):
+        """Изменение p95, пропускной способности и числа запросов по эндпоинтам относительно прошлого прогона"""
+        self.stdout.write(f"Сравнение с прогоном от {previous.get('started_at')}:")
+        for label, stats in current['endpoints'].items():
+            old = previous.get('endpoints', {}).get(label)
+            if not old:
+                self.stdout.write(f'{label}: нет в прошлом прогоне')
+                continue
+            change = (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            self.stdout.write(f"{label}: p95 {old['p95_ms']:.1f} -> {stats['p95_ms']:.1f} мс ({change:+.0f}%), "
+                              f"rps {old['throughput_rps']:.1f} -> {stats['throughput_rps']:.1f}, "
+                              f"SQL {old['queries_mean']} -> {stats['queries_mean']}")
+        self.stdout.write(f"Всего: {previous['throughput_rps']} -> {current['throughput_rps']} запросов/с")
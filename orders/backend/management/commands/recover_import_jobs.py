@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from backend.jobs import recover_import_jobs, wait_for_jobs
+
+
+class Command(BaseCommand):
+    help = 'Подобрать задачи импорта, брошенные остановленными процессами, и выполнить задачи из очереди'
+
+    def handle(self, *args, **options):
+        try:
+            failed, job_ids = recover_import_jobs()
+        except DatabaseError as error:
+            raise CommandError(f'Не удалось восстановить задачи импорта: {error}')
+        self.stdout.write(f'Завершено с ошибкой: {failed}, поставлено в очередь заново: {len(job_ids)}')
+        # задачи из очереди выполняются в этом процессе, команда ждёт их завершения
+        wait_for_jobs()
+        self.stdout.write(self.style.SUCCESS('Готово'))
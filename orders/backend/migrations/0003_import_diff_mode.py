@@ -0,0 +1,60 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:04
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def fill_fingerprints(apps, schema_editor):
+    """Посчитать отпечатки параметров уже загруженных позиций"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.values_list(
+            'product_info_id', 'parameter__name', 'value').iterator():
+        parameters.setdefault(product_info_id, []).append((name, value))
+
+    product_infos = []
+    for product_info in ProductInfo.objects.only('id').iterator():
+        payload = json.dumps(sorted(parameters.get(product_info.id, [])), ensure_ascii=False)
+        product_info.fingerprint = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        product_infos.append(product_info)
+    ProductInfo.objects.bulk_update(product_infos, ['fingerprint'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_import_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='created',
+            field=models.PositiveIntegerField(default=0, verbose_name='Создано позиций'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='deleted',
+            field=models.PositiveIntegerField(default=0, verbose_name='Удалено позиций'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('replace', 'Полная замена'), ('diff', 'Только изменения')], default='diff', max_length=20, verbose_name='Режим'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='updated',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обновлено позиций'),
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='Отпечаток параметров'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(model, relations):
+    """Оставить запись с наименьшим id для каждого названия и перевесить на неё ссылки"""
+    duplicates = model.objects.values('name').annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        ids = list(model.objects.filter(name=duplicate['name']).exclude(id=duplicate['keep_id']).values_list(
+            'id', flat=True))
+        for related_model, field in relations:
+            related_model.objects.filter(**{f'{field}__in': ids}).update(**{field: duplicate['keep_id']})
+        yield duplicate['keep_id'], ids
+
+
+def merge_duplicate_names(apps, schema_editor):
+    Category = apps.get_model('backend', 'Category')
+    Product = apps.get_model('backend', 'Product')
+    Parameter = apps.get_model('backend', 'Parameter')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    CategoryShops = Category.shops.through
+
+    for keep_id, ids in merge_duplicates(Category, [(Product, 'category_id')]):
+        shop_ids = set(CategoryShops.objects.filter(category_id__in=ids).values_list('shop_id', flat=True))
+        shop_ids -= set(CategoryShops.objects.filter(category_id=keep_id).values_list('shop_id', flat=True))
+        CategoryShops.objects.bulk_create([CategoryShops(category_id=keep_id, shop_id=shop_id) for shop_id in shop_ids])
+        Category.objects.filter(id__in=ids).delete()
+
+    for keep_id, ids in merge_duplicates(Product, [(ProductInfo, 'product_id')]):
+        Product.objects.filter(id__in=ids).delete()
+
+    for keep_id, ids in merge_duplicates(Parameter, [(ProductParameter, 'parameter_id')]):
+        Parameter.objects.filter(id__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_import_diff_mode'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_merge_duplicate_names'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название'),
+        ),
+        migrations.AlterField(
+            model_name='parameter',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название'),
+        ),
+    ]
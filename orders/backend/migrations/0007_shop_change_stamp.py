@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='changed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Прайс изменён'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия прайса'),
+        ),
+    ]
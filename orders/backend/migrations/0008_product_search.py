@@ -0,0 +1,55 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:13
+
+import re
+
+from django.db import migrations, models
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fill_search_text(apps, schema_editor):
+    """Собрать текст для поиска по уже загруженным позициям"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+
+    values = {}
+    for product_info_id, value in ProductParameter.objects.values_list('product_info_id', 'value').iterator():
+        values.setdefault(product_info_id, []).append(value)
+
+    product_infos = []
+    for product_info in ProductInfo.objects.select_related('product').only('id', 'product__name').iterator():
+        text = ' '.join([product_info.product.name, *values.get(product_info.id, [])])
+        product_info.search_text = ' '.join(TOKEN_RE.findall(text.lower()))
+        product_infos.append(product_info)
+    ProductInfo.objects.bulk_update(product_infos, ['search_text'], batch_size=1000)
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS backend_productinfo_search_trgm '
+                          'ON backend_productinfo USING gin (search_text gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS backend_productinfo_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_shop_change_stamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_text',
+            field=models.TextField(blank=True, default='', verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+def fill_parameters(apps, schema_editor):
+    """Собрать документ параметров уже загруженных позиций"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.values_list(
+            'product_info_id', 'parameter__name', 'value').iterator():
+        parameters.setdefault(product_info_id, {})[name] = value
+
+    product_infos = []
+    for product_info in ProductInfo.objects.only('id').iterator():
+        product_info.parameters = parameters.get(product_info.id, {})
+        product_infos.append(product_info)
+    ProductInfo.objects.bulk_update(product_infos, ['parameters'], batch_size=1000)
+
+
+def create_parameters_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS backend_productinfo_parameters_gin '
+                          'ON backend_productinfo USING gin (parameters jsonb_path_ops)')
+
+
+def drop_parameters_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS backend_productinfo_parameters_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='parameters',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Параметры'),
+        ),
+        migrations.RunPython(fill_parameters, migrations.RunPython.noop),
+        migrations.RunPython(create_parameters_index, drop_parameters_index),
+    ]
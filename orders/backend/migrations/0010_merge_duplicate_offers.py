@@ -0,0 +1,59 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min, Sum
+
+
+def merge_duplicate_offers(apps, schema_editor):
+    """Оставить одну позицию магазина на товар (последнюю загруженную) и перевесить на неё заказы"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+
+    duplicates = ProductInfo.objects.values('shop_id', 'product_id').annotate(
+        keep_id=Max('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        ids = list(ProductInfo.objects.filter(shop_id=duplicate['shop_id'], product_id=duplicate['product_id']).exclude(
+            id=duplicate['keep_id']).values_list('id', flat=True))
+        OrderItem.objects.filter(product_info_id__in=ids).update(product_info_id=duplicate['keep_id'])
+        ProductInfo.objects.filter(id__in=ids).delete()
+
+
+def merge_duplicate_baskets(apps, schema_editor):
+    """Оставить у пользователя одну корзину и перенести в неё позиции остальных"""
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+
+    duplicates = Order.objects.filter(state='basket').values('user_id').annotate(
+        keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        ids = list(Order.objects.filter(user_id=duplicate['user_id'], state='basket').exclude(
+            id=duplicate['keep_id']).values_list('id', flat=True))
+        OrderItem.objects.filter(order_id__in=ids).update(order_id=duplicate['keep_id'])
+        Order.objects.filter(id__in=ids).delete()
+
+
+def merge_duplicate_order_items(apps, schema_editor):
+    """Сложить количество повторяющихся позиций заказа в одну"""
+    OrderItem = apps.get_model('backend', 'OrderItem')
+
+    duplicates = OrderItem.objects.values('order_id', 'product_info_id').annotate(
+        keep_id=Min('id'), total=Count('id'), quantity=Sum('quantity')).filter(total__gt=1)
+    for duplicate in duplicates:
+        OrderItem.objects.filter(id=duplicate['keep_id']).update(quantity=duplicate['quantity'])
+        OrderItem.objects.filter(order_id=duplicate['order_id'], product_info_id=duplicate['product_info_id']).exclude(
+            id=duplicate['keep_id']).delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    merge_duplicate_offers(apps, schema_editor)
+    merge_duplicate_baskets(apps, schema_editor)
+    merge_duplicate_order_items(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_product_parameters_document'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
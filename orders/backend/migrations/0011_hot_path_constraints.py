@@ -0,0 +1,34 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_merge_duplicate_offers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shop',
+            name='state',
+            field=models.CharField(choices=[('OPEN', 'Открыт'), ('CLOSED', 'Закрыт')], db_index=True, default='OPEN', max_length=20, verbose_name='Приём заказов'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 'basket')), fields=('user',), name='unique_user_basket'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product_info'), name='unique_order_product_info'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinfo',
+            constraint=models.UniqueConstraint(fields=('shop', 'product'), name='unique_shop_product'),
+        ),
+    ]
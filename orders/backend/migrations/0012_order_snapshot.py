@@ -0,0 +1,69 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F, Sum
+
+
+def fill_snapshots(apps, schema_editor):
+    """Сохранить цены и названия в позициях уже оформленных заказов"""
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+
+    items = []
+    for item in OrderItem.objects.exclude(order__state='basket').filter(product_info__isnull=False).select_related(
+            'product_info__product', 'product_info__shop').iterator():
+        item.price = item.product_info.price
+        item.product_name = item.product_info.product.name
+        item.shop_id = item.product_info.shop_id
+        item.shop_name = item.product_info.shop.name
+        items.append(item)
+    OrderItem.objects.bulk_update(items, ['price', 'product_name', 'shop', 'shop_name'], batch_size=1000)
+
+    orders = []
+    for order in Order.objects.exclude(state='basket').annotate(
+            total=Sum(F('order_items__quantity') * F('order_items__price'))).filter(total__isnull=False).iterator():
+        order.total_price = order.total
+        orders.append(order)
+    Order.objects.bulk_update(orders, ['total_price'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_hot_path_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Цена'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Товар'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='backend.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop_name',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Название магазина'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_info',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='backend.productinfo', verbose_name='Информация о продукте'),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shop_orders(apps, schema_editor):
+    """Построить заказы магазинов по уже оформленным заказам"""
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ShopOrder = apps.get_model('backend', 'ShopOrder')
+
+    orders = {order.id: order for order in Order.objects.exclude(state='basket').select_related('buyer')}
+    shop_orders = {}
+    for item in OrderItem.objects.filter(order_id__in=orders, shop__isnull=False, price__isnull=False).order_by('id'):
+        order = orders[item.order_id]
+        shop_order = shop_orders.get((item.shop_id, order.id))
+        if shop_order is None:
+            buyer = {'id': order.buyer.id, 'name': order.buyer.name, 'address': order.buyer.address,
+                     'phone': order.buyer.phone, 'user': order.buyer.user_id} if order.buyer else {}
+            shop_order = shop_orders[item.shop_id, order.id] = ShopOrder(
+                shop_id=item.shop_id, order_id=order.id, state=order.state, created_at=order.created_at,
+                buyer=buyer, subtotal=0, lines=[])
+        shop_order.subtotal += item.price * item.quantity
+        shop_order.lines.append({'id': item.id, 'product_info': item.product_info_id,
+                                 'product_name': item.product_name, 'price': item.price, 'quantity': item.quantity})
+    ShopOrder.objects.bulk_create(sorted(shop_orders.values(), key=lambda shop_order: shop_order.order_id),
+                                  batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_order_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('basket', 'Статус корзины'), ('new', 'Новый'), ('confirmed', 'Подтвержден'), ('assembled', 'Собран'), ('sent', 'Отправлен'), ('delivered', 'Доставлен'), ('canceled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Создан')),
+                ('buyer', models.JSONField(blank=True, default=dict, verbose_name='Покупатель')),
+                ('subtotal', models.PositiveIntegerField(verbose_name='Сумма по магазину')),
+                ('lines', models.JSONField(blank=True, default=list, verbose_name='Позиции')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.order', verbose_name='Заказ')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Заказ магазина',
+                'verbose_name_plural': 'Список заказов магазинов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='shoporder',
+            index=models.Index(fields=['shop', 'id'], name='shoporder_shop_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoporder',
+            constraint=models.UniqueConstraint(fields=('shop', 'order'), name='unique_shop_order'),
+        ),
+        migrations.RunPython(fill_shop_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_shop_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='unchanged',
+            field=models.BooleanField(default=False, verbose_name='Прайс не изменился'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='price_etag',
+            field=models.CharField(blank=True, max_length=200, verbose_name='ETag прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='price_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='SHA-256 прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='price_last_modified',
+            field=models.CharField(blank=True, max_length=50, verbose_name='Last-Modified прайса'),
+        ),
+    ]
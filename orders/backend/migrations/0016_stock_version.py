@@ -0,0 +1,33 @@
+# Generated by Django 3.2.6 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_import_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogversion',
+            name='stock_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Остатки изменены'),
+        ),
+        migrations.AddField(
+            model_name='catalogversion',
+            name='stock_version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия остатков'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='stock_changed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Остатки изменены'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='stock_version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия остатков'),
+        ),
+    ]
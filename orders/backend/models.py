@@ -19,10 +19,17 @@ class Shop(models.Model):
     name = models.CharField(max_length=50, verbose_name='Название')
     url = models.URLField(verbose_name='Ссылка', null=True, blank=True)
     state = models.CharField(verbose_name='Приём заказов', choices=ShopStatusChoices.choices, max_length=20,
-                            default=ShopStatusChoices.OPEN)
+                            default=ShopStatusChoices.OPEN, db_index=True)
     user = models.OneToOneField('User', verbose_name='Пользователь',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
+    version = models.PositiveBigIntegerField(verbose_name='Версия прайса', default=0)
+    changed_at = models.DateTimeField(verbose_name='Прайс изменён', blank=True, null=True)
+    stock_version = models.PositiveBigIntegerField(verbose_name='Версия остатков', default=0)
+    stock_changed_at = models.DateTimeField(verbose_name='Остатки изменены', blank=True, null=True)
+    price_etag = models.CharField(verbose_name='ETag прайса', max_length=200, blank=True)
+    price_last_modified = models.CharField(verbose_name='Last-Modified прайса', max_length=50, blank=True)
+    price_hash = models.CharField(verbose_name='SHA-256 прайса', max_length=64, blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -35,7 +42,7 @@ class Shop(models.Model):
 class Category(models.Model):
     """Категории товаров"""
 
-    name = models.CharField(max_length=50, verbose_name='Название')
+    name = models.CharField(max_length=50, verbose_name='Название', unique=True)
     shops = models.ManyToManyField('Shop', verbose_name='Магазины', related_name='categories', blank=True)
 
     class Meta:
@@ -49,7 +56,7 @@ class Category(models.Model):
 class Product(models.Model):
     """Товар"""
 
-    name = models.CharField(max_length=50, verbose_name='Название')
+    name = models.CharField(max_length=50, verbose_name='Название', unique=True)
     category = models.ForeignKey('Category', verbose_name='Категория', related_name='products', blank=True, null=True,
                                  on_delete=models.CASCADE)
 
@@ -70,11 +77,17 @@ class ProductInfo(models.Model):
                                      on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
+    fingerprint = models.CharField(verbose_name='Отпечаток параметров', max_length=40, blank=True, default='')
+    search_text = models.TextField(verbose_name='Текст для поиска', blank=True, default='')
+    parameters = models.JSONField(verbose_name='Параметры', blank=True, default=dict)
 
 
     class Meta:
         verbose_name = 'Цена на товар в магазине'
         verbose_name_plural = "Список цен по магазинам"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'product'], name='unique_shop_product'),
+        ]
 
     def __str__(self):
         return f'{self.shop} - {self.product}. Цена: {self.price}'
@@ -83,7 +96,7 @@ class ProductInfo(models.Model):
 
 class Parameter(models.Model):
     """Уникальные параметры товара"""
-    name = models.CharField(max_length=50, verbose_name='Название')
+    name = models.CharField(max_length=50, verbose_name='Название', unique=True)
 
     class Meta:
         verbose_name = 'Имя параметра'
@@ -110,6 +123,69 @@ class ProductParameter(models.Model):
         return f'{self.parameter} {self.product_info} {self.value}'
 
 
+class CatalogVersion(models.Model):
+    """Версия каталога: увеличивается при каждом изменении товаров или магазинов"""
+    version = models.PositiveBigIntegerField(verbose_name='Версия', default=0)
+    updated_at = models.DateTimeField(verbose_name='Изменён', auto_now=True)
+    stock_version = models.PositiveBigIntegerField(verbose_name='Версия остатков', default=0)
+    stock_updated_at = models.DateTimeField(verbose_name='Остатки изменены', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = "Версии каталога"
+
+    def __str__(self):
+        return f'{self.version} {self.updated_at}'
+
+
+class ImportJobStatusChoices(models.TextChoices):
+    """Статусы задачи импорта прайса"""
+
+    PENDING = 'pending', 'В очереди'
+    RUNNING = 'running', 'Выполняется'
+    DONE = 'done', 'Завершена'
+    FAILED = 'failed', 'Ошибка'
+
+
+class ImportModeChoices(models.TextChoices):
+    """Режимы импорта прайса"""
+
+    REPLACE = 'replace', 'Полная замена'
+    DIFF = 'diff', 'Только изменения'
+
+
+class ImportJob(models.Model):
+    """Задача фонового импорта прайс-листа поставщика"""
+    user = models.ForeignKey('User', verbose_name='Пользователь', related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey('Shop', verbose_name='Магазин', related_name='import_jobs', blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    url = models.URLField(verbose_name='Ссылка')
+    mode = models.CharField(verbose_name='Режим', choices=ImportModeChoices.choices, max_length=20,
+                            default=ImportModeChoices.DIFF)
+    status = models.CharField(verbose_name='Статус', choices=ImportJobStatusChoices.choices, max_length=20,
+                              default=ImportJobStatusChoices.PENDING)
+    progress = models.PositiveSmallIntegerField(verbose_name='Прогресс, %', default=0)
+    rows = models.PositiveIntegerField(verbose_name='Обработано позиций', default=0)
+    created = models.PositiveIntegerField(verbose_name='Создано позиций', default=0)
+    updated = models.PositiveIntegerField(verbose_name='Обновлено позиций', default=0)
+    deleted = models.PositiveIntegerField(verbose_name='Удалено позиций', default=0)
+    unchanged = models.BooleanField(verbose_name='Прайс не изменился', default=False)
+    duration = models.FloatField(verbose_name='Длительность, с', blank=True, null=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(verbose_name='Последняя отметка выполнения', blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = "Список задач импорта"
+
+    def __str__(self):
+        return f'{self.user} {self.url} {self.status}'
+
+
 class OrderStateChoices(models.TextChoices):
     """Статусы доставки товара."""
 
@@ -133,11 +209,19 @@ class Order(models.Model):
     buyer = models.ForeignKey('Buyer', verbose_name='Покупатель',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
+    total_price = models.PositiveIntegerField(verbose_name='Сумма заказа', blank=True, null=True)
 
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказов"
+        indexes = [
+            models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user'], condition=models.Q(state=OrderStateChoices.BASKET),
+                                    name='unique_user_basket'),
+        ]
 
     def __str__(self):
         return f'{self.user} {str(self.created_at)} {self.state}'
@@ -148,18 +232,55 @@ class OrderItem(models.Model):
     order = models.ForeignKey('Order', verbose_name='Заказ', related_name='order_items', blank=True,
                               on_delete=models.CASCADE)
     product_info = models.ForeignKey('ProductInfo', verbose_name='Информация о продукте', related_name='order_items',
-                                     blank=True,
-                                     on_delete=models.CASCADE)
+                                     blank=True, null=True,
+                                     on_delete=models.SET_NULL)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    # снимок позиции на момент оформления заказа
+    price = models.PositiveIntegerField(verbose_name='Цена', blank=True, null=True)
+    product_name = models.CharField(verbose_name='Товар', max_length=50, blank=True, default='')
+    shop = models.ForeignKey('Shop', verbose_name='Магазин', related_name='order_items', blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    shop_name = models.CharField(verbose_name='Название магазина', max_length=50, blank=True, default='')
 
     class Meta:
         verbose_name = 'Элемент заказа'
         verbose_name_plural = "Список элементов заказа"
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product_info'], name='unique_order_product_info'),
+        ]
 
     def __str__(self):
         return f'Заказ:{self.order} | Продукт:{self.product_info} | Количество:{self.quantity}'
 
 
+class ShopOrder(models.Model):
+    """Заказ глазами поставщика: строки одного магазина из заказа покупателя.
+
+    Записывается при оформлении заказа, чтобы список заказов поставщика
+    читался одним запросом по индексу без соединения с позициями заказов.
+    """
+    shop = models.ForeignKey('Shop', verbose_name='Магазин', related_name='shop_orders', on_delete=models.CASCADE)
+    order = models.ForeignKey('Order', verbose_name='Заказ', related_name='shop_orders', on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус', choices=OrderStateChoices.choices, max_length=20)
+    created_at = models.DateTimeField(verbose_name='Создан')
+    buyer = models.JSONField(verbose_name='Покупатель', blank=True, default=dict)
+    subtotal = models.PositiveIntegerField(verbose_name='Сумма по магазину')
+    lines = models.JSONField(verbose_name='Позиции', blank=True, default=list)
+
+    class Meta:
+        verbose_name = 'Заказ магазина'
+        verbose_name_plural = "Список заказов магазинов"
+        indexes = [
+            models.Index(fields=['shop', 'id'], name='shoporder_shop_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'order'], name='unique_shop_order'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop} | {self.order_id} {self.state}'
+
+
 class UserTypeChoices(models.TextChoices):
     """Типы пользователей"""
 
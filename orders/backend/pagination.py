@@ -0,0 +1,94 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class IdCursorPagination(CursorPagination):
+    """Постраничный вывод по курсору в порядке первичного ключа.
+
+    Следующая страница выбирается условием по id из непрозрачного курсора,
+    поэтому время ответа не растёт с глубиной листания, в отличие от OFFSET.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+
+
+class OrderCursorPagination(IdCursorPagination):
+    """Постраничный вывод заказов по курсору (сначала новые)"""
+    ordering = '-id'
+    page_size = 20
+    max_page_size = 100
+
+
+class SearchPagination(BasePagination):
+    """Постраничный вывод результатов поиска в порядке релевантности.
+
+    Курсор хранит смещение в отсортированной по релевантности выдаче,
+    глубина которой ограничена настройкой SEARCH_MAX_RESULTS.
+    """
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        self.offset = self.decode_cursor(request)
+        max_results = getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+
+        ranking = getattr(request, 'search_ranking', None)
+        if ranking is not None:
+            rows = sorted(queryset, key=lambda obj: ranking[obj.id])[self.offset:self.offset + self.limit + 1]
+        else:
+            # запрос без слов не фильтрует и не сортирует выдачу, а смещению нужен устойчивый порядок
+            if not queryset.ordered:
+                queryset = queryset.order_by('id')
+            rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit and self.offset + self.limit < max_results
+        return rows[:self.limit]
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return 0
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            return _positive_int(parse.parse_qs(querystring, keep_blank_values=True)['o'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, offset):
+        if offset <= 0:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        encoded = b64encode(parse.urlencode({'o': offset}).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        return self.encode_cursor(self.offset + self.limit) if self.has_next else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(max(self.offset - self.limit, 0)) if self.offset else None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
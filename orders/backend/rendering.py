@@ -0,0 +1,149 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_json(data):
+    """JSON в том же виде, что у JSONRenderer без отступов: компактный UTF-8"""
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data)
+        except TypeError:
+            pass
+        else:
+            # как и JSONRenderer, экранируем разделители строк, недопустимые в JavaScript
+            return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+    content = json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+class RowMapper:
+    """Преобразование строк values_list() в словари ответа без сериализаторов DRF.
+
+    spec - список пар (ключ, источник) в порядке полей сериализатора, где
+    источник - имя поля для values_list(), пара (поле, функция преобразования)
+    или вложенный spec. По spec один раз собирается функция вида
+    lambda row: {'id': row[0], 'product': {'name': row[1], ...}, ...}.
+    Поля из extra выбираются, но в ответ не попадают (например, id для курсора).
+    """
+
+    def __init__(self, spec, extra=('id',)):
+        self.fields = []
+        converters = {}
+
+        def index(field):
+            if field not in self.fields:
+                self.fields.append(field)
+            return self.fields.index(field)
+
+        def build(spec):
+            items = []
+            for key, source in spec:
+                if isinstance(source, list):
+                    expression = build(source)
+                elif isinstance(source, tuple):
+                    field, converter = source
+                    name = f'convert_{len(converters)}'
+                    converters[name] = converter
+                    expression = f'{name}(row[{index(field)}])'
+                else:
+                    expression = f'row[{index(source)}]'
+                items.append(f'{key!r}: {expression}')
+            return '{' + ', '.join(items) + '}'
+
+        source = f'lambda row: {build(spec)}'
+        for field in extra:
+            index(field)
+        self.map = eval(compile(source, '<RowMapper>', 'eval'), converters)
+
+    def map_rows(self, rows):
+        return [self.map(row) for row in rows]
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson (если установлен) с тем же выводом байт в байт"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return encode_json(data)
+
+
+class FastListMixin:
+    """Быстрый список: строки values_list() и RowMapper вместо ModelSerializer.
+
+    Вывод совпадает с serializer_class; включается настройкой FAST_SERIALIZATION
+    и используется только для JSON (браузерный API работает через сериализатор).
+    """
+    row_mapper = None
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        if self.row_mapper is None or not getattr(settings, 'FAST_SERIALIZATION', True) \
+                or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*self.row_mapper.fields, named=True)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.row_mapper.map_rows(page))
+        return Response(self.row_mapper.map_rows(queryset))
+
+
+class StreamingListMixin:
+    """Потоковая выдача всего списка по ?stream=1 в виде JSON-массива строк.
+
+    Строки читаются iterator() пачками по STREAM_CHUNK_SIZE (в PostgreSQL -
+    серверным курсором) и сразу отдаются клиенту, так что память процесса не
+    зависит от размера каталога. Фильтры списка применяются как обычно,
+    постраничный вывод и кэш ответов - нет.
+
+    Фильтры применяются до начала ответа, так что ошибка в параметрах
+    запроса возвращается как обычный ответ 400, а не обрывает поток.
+
+    Под ASGI Django 3.2 читает потоковый ответ прямо в цикле событий, где
+    запросы к базе запрещены, поэтому там ?stream=1 не действует и отдаётся
+    обычный постраничный список.
+    """
+    stream_query_param = 'stream'
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_query_param) not in ('1', 'true') \
+                or isinstance(request._request, ASGIRequest):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('id')
+        rows = queryset.values_list(*self.row_mapper.fields, named=True)
+
+        ranking = getattr(request, 'search_ranking', None)
+        if ranking is not None:
+            # выдача поиска без pg_trgm ограничена SEARCH_MAX_RESULTS и упорядочивается в памяти
+            rows = sorted(rows, key=lambda row: ranking[row.id])
+        else:
+            rows = rows.iterator(chunk_size=getattr(settings, 'STREAM_CHUNK_SIZE', 2000))
+        return StreamingHttpResponse(self.stream_rows(rows), content_type='application/json')
+
+    def stream_rows(self, rows):
+        # строки отдаются пачками, чтобы не писать в сокет по одной
+        rows = iter(rows)
+        separator = b'['
+        while True:
+            batch = [encode_json(self.row_mapper.map(row)) for row in islice(rows, 200)]
+            if not batch:
+                break
+            yield separator + b','.join(batch)
+            separator = b','
+        yield b']' if separator == b',' else b'[]'
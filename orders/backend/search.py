@@ -0,0 +1,141 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Func, Value
+from rest_framework.filters import BaseFilterBackend
+
+from backend.models import Shop, ProductInfo
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def build_search_text(name, parameters):
+    """Текст для поиска по позиции: название товара и значения его параметров"""
+    return ' '.join(tokenize(' '.join([name, *map(str, parameters.values())])))
+
+
+class WordSimilarity(Func):
+    """Функция word_similarity из расширения pg_trgm"""
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+
+class ShopSegment:
+    """Инвертированный индекс позиций одного магазина"""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.postings = defaultdict(set)
+        for product_info_id, search_text in rows:
+            for token in set(tokenize(search_text)):
+                self.postings[token].add(product_info_id)
+        self.vocabulary = sorted(self.postings)
+
+    def match(self, token):
+        """Позиции со словом token (2 балла) или словом, начинающимся с token (1 балл)"""
+        scores = dict.fromkeys(self.postings.get(token, ()), 2)
+        position = bisect_left(self.vocabulary, token)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(token):
+            word = self.vocabulary[position]
+            if word != token:
+                for product_info_id in self.postings[word]:
+                    scores.setdefault(product_info_id, 1)
+            position += 1
+        return scores
+
+
+def build_search_segment(shop_id, version):
+    """Поисковый сегмент магазина из search_text, записанного импортом"""
+    return ShopSegment(version, ProductInfo.objects.filter(shop_id=shop_id).values_list('id', 'search_text'))
+
+
+class ShopIndex:
+    """Индекс в памяти процесса, разбитый на сегменты по магазинам.
+
+    Сегмент магазина перестраивается, только когда меняется версия магазина
+    (импорт прайса или смена статуса), так что импорт одного прайса не трогает
+    сегменты остальных магазинов. Сегменты строит build_segment(shop_id, version).
+    """
+
+    def __init__(self, build_segment):
+        self.build_segment = build_segment
+        self.segments = {}
+        self.lock = threading.Lock()
+
+    def get_segments(self, shop_ids):
+        """Выдавать пары (shop_id, сегмент) актуальной версии"""
+        for shop_id, version in Shop.objects.filter(id__in=shop_ids).values_list('id', 'version'):
+            segment = self.segments.get(shop_id)
+            if segment is None or segment.version != version:
+                segment = self.build_segment(shop_id, version)
+                with self.lock:
+                    self.segments[shop_id] = segment
+            yield shop_id, segment
+
+
+class InMemorySearchIndex(ShopIndex):
+    """Поисковый индекс в памяти процесса для баз без pg_trgm (SQLite)"""
+
+    def __init__(self):
+        super().__init__(build_search_segment)
+
+    def search(self, tokens, shop_ids, limit):
+        """id позиций, где встречаются все слова запроса, по убыванию релевантности"""
+        scores = {}
+        for shop_id, segment in self.get_segments(shop_ids):
+            shop_scores = None
+            for token in tokens:
+                token_scores = segment.match(token)
+                if shop_scores is None:
+                    shop_scores = token_scores
+                else:
+                    shop_scores = {product_info_id: score + token_scores[product_info_id]
+                                   for product_info_id, score in shop_scores.items()
+                                   if product_info_id in token_scores}
+            scores.update(shop_scores or {})
+        return sorted(scores, key=lambda product_info_id: (-scores[product_info_id], product_info_id))[:limit]
+
+
+search_index = InMemorySearchIndex()
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск позиций по параметру ?q= с сортировкой по релевантности.
+
+    Позиция находится, если для каждого слова запроса в её названии или
+    параметрах есть слово, которое с него начинается. В PostgreSQL это
+    регулярное выражение по триграммному GIN-индексу на search_text, а
+    результаты сортируются по word_similarity. В остальных базах
+    используется InMemorySearchIndex, где точное совпадение слова весит
+    больше совпадения начала; порядок результатов передаётся пагинатору
+    через request.search_ranking. Набор найденных позиций в обоих случаях
+    один и тот же, порядок позиций с близкой релевантностью может отличаться.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        tokens = tokenize(request.query_params.get(self.search_param, ''))
+        if not tokens:
+            return queryset
+
+        max_results = getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+        if connection.vendor == 'postgresql':
+            for token in tokens:
+                # search_text - слова через пробел, так что это слово, начинающееся с token
+                queryset = queryset.filter(search_text__regex=f'(^| ){token}')
+            return queryset.annotate(rank=WordSimilarity(Value(' '.join(tokens)), 'search_text')).order_by(
+                '-rank', 'id')
+
+        shop_ids = queryset.order_by().values_list('shop_id', flat=True).distinct()
+        ranked_ids = search_index.search(tokens, list(shop_ids), max_results)
+        request.search_ranking = {product_info_id: position for position, product_info_id in enumerate(ranked_ids)}
+        return queryset.filter(id__in=ranked_ids)
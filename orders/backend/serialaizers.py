@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from backend.models import Shop, Product, ProductInfo, OrderItem, Order, Buyer, Category, User
+
+from backend.rendering import RowMapper
+from backend.models import Shop, Product, ProductInfo, OrderItem, Order, Buyer, Category, User, ImportJob, ShopOrder
 
 
 
@@ -29,7 +31,7 @@ class ProductInfoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProductInfo
-        fields = ('id', 'product', 'shop', 'quantity', 'price',)
+        fields = ('id', 'product', 'shop', 'quantity', 'price', 'parameters',)
 
 
 class BuyerSerializer(serializers.ModelSerializer):
@@ -55,6 +57,23 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ('id', 'order', 'product_info', 'quantity',)
 
 
+class OrderHistoryItemSerializer(serializers.ModelSerializer):
+    """Позиция оформленного заказа по снимку, сделанному при оформлении"""
+
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'order', 'product_info', 'product_name', 'shop_name', 'price', 'quantity',)
+
+
+class ShopOrderSerializer(serializers.ModelSerializer):
+    """Заказ поставщика: только его строки и сумма по ним"""
+    id = serializers.IntegerField(source='order_id')
+
+    class Meta:
+        model = ShopOrder
+        fields = ('id', 'buyer', 'created_at', 'state', 'subtotal', 'lines',)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -69,6 +88,36 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'type', 'contacts')
 
 
+class ImportJobSerializer(serializers.ModelSerializer):
+    shop = serializers.StringRelatedField()
 
-
-
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'shop', 'mode', 'status', 'progress', 'rows', 'created', 'updated', 'deleted',
+                  'unchanged', 'duration', 'error', 'created_at', 'started_at', 'finished_at')
+
+
+# Строки для быстрого вывода списков (FastListMixin): ключи и порядок полей
+# должны совпадать с соответствующими сериализаторами
+PRODUCT_ROW = RowMapper([
+    ('name', 'name'),
+    ('category', 'category__name'),
+])
+
+PRODUCT_INFO_ROW = RowMapper([
+    ('id', 'id'),
+    ('product', [('name', 'product__name'), ('category', 'product__category__name')]),
+    ('shop', 'shop__name'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+    ('parameters', 'parameters'),
+])
+
+SHOP_ORDER_ROW = RowMapper([
+    ('id', 'order_id'),
+    ('buyer', 'buyer'),
+    ('created_at', ('created_at', serializers.DateTimeField().to_representation)),
+    ('state', 'state'),
+    ('subtotal', 'subtotal'),
+    ('lines', 'lines'),
+])
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from backend.authentication import forget_tokens
+from backend.models import Order, ShopOrder, User
+
+
+@receiver(post_save, sender=Order)
+def sync_shop_order_state(sender, instance, created, **kwargs):
+    """Перенести статус заказа (например, изменённый в админке) в заказы магазинов"""
+    if not created:
+        ShopOrder.objects.filter(order_id=instance.id).exclude(state=instance.state).update(state=instance.state)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    """Сбросить кэш аутентификации пользователя: могли измениться is_active или type"""
+    if not created:
+        forget_tokens(*Token.objects.filter(user_id=instance.id).values_list('key', flat=True))
+
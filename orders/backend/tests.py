@@ -1,3 +1,1005 @@
-from django.test import TestCase
+import copy
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import yaml
+from asgiref.sync import async_to_sync
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from backend.async_views import wait_for_downloads
+from backend.authentication import CachedTokenAuthentication, token_cache, token_stamp_key
+from backend.cache import catalog_cache
+from backend.checkout import InsufficientStock, checkout_basket
+from backend.facets import facet_index
+from backend.fetch import SupplierFetchError, fetch_price_list
+from backend.importer import PriceListImporter, read_price_list, read_shop_name
+from backend.jobs import import_from_url, recover_import_jobs
+from backend.models import Buyer, Category, ImportJob, ImportJobStatusChoices, ImportModeChoices, Order, \
+    OrderItem, OrderStateChoices, Parameter, Product, ProductInfo, ProductParameter, Shop, ShopOrder, \
+    ShopStatusChoices, User, UserTypeChoices
+from backend.search import search_index
+
+
+PRICE_LIST = {
+    'shop': 'Связной',
+    'categories': [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары'}],
+    'goods': [
+        {'id': 4216292, 'category': 224, 'name': 'Смартфон Apple iPhone XS Max 512GB (золотистый)',
+         'price': 110000, 'price_rrc': 116990, 'quantity': 14,
+         'parameters': {'Диагональ (дюйм)': 6.5, 'Разрешение (пикс)': '2688x1242', 'Цвет': 'золотистый'}},
+        {'id': 4216313, 'category': 224, 'name': 'Смартфон Apple iPhone XR 256GB (красный)',
+         'price': 65000, 'price_rrc': 69990, 'quantity': 9,
+         'parameters': {'Диагональ (дюйм)': 6.1, 'Разрешение (пикс)': '1792x828', 'Цвет': 'красный'}},
+        {'id': 4672670, 'category': 15, 'name': 'Чехол для iPhone XR (прозрачный)',
+         'price': 1490, 'price_rrc': 1990, 'quantity': 50,
+         'parameters': {'Цвет': 'прозрачный'}},
+    ],
+}
+
+SECOND_PRICE_LIST = {
+    'shop': 'Ситилинк',
+    'categories': [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары'}],
+    'goods': [
+        {'id': 1, 'category': 224, 'name': 'Смартфон Apple iPhone XR 256GB (красный)', 'price': 63000, 'quantity': 4,
+         'parameters': {'Диагональ (дюйм)': 6.1, 'Разрешение (пикс)': '1792x828', 'Цвет': 'красный'}},
+        {'id': 2, 'category': 15, 'name': 'Кабель USB-C X', 'price': 590, 'quantity': 100,
+         'parameters': {'Цвет': 'черный'}},
+    ],
+}
+
+
+def dump_price_list(data, **kwargs):
+    return io.BytesIO(yaml.dump(data, allow_unicode=True, **kwargs).encode('utf-8'))
+
+
+def baseline_import(data, user_id, url):
+    """Импорт прайса по одной строке, как его делал ShopUpdateView до пакетного импортёра"""
+    shop = Shop.objects.get_or_create(name=data['shop'], user_id=user_id, url=url)[0]
+    for category_data in data['categories']:
+        category = Category.objects.get_or_create(name=category_data['name'])[0]
+        category.shops.add(shop.id)
+    ProductInfo.objects.filter(shop_id=shop.id).delete()
+    for product_data in data['goods']:
+        product = Product.objects.get_or_create(name=product_data['name'])[0]
+        product_info = ProductInfo.objects.create(product_id=product.id, shop_id=shop.id,
+                                                  price=product_data['price'], quantity=product_data['quantity'])
+        for key, value in product_data['parameters'].items():
+            parameter = Parameter.objects.get_or_create(name=key)[0]
+            ProductParameter.objects.create(product_info_id=product_info.id, parameter_id=parameter.id, value=value)
+
+
+def catalog_snapshot():
+    """Содержимое каталога без id: магазины, категории магазинов и позиции с параметрами"""
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.values_list(
+            'product_info_id', 'parameter__name', 'value'):
+        parameters.setdefault(product_info_id, set()).add((name, value))
+    return {
+        'shops': sorted(Shop.objects.values_list('name', 'user_id', 'url')),
+        'categories': sorted(Category.objects.values_list('name', 'shops__name')),
+        'offers': sorted((shop, product, price, quantity, frozenset(parameters.get(product_info_id, ())))
+                         for product_info_id, shop, product, price, quantity in ProductInfo.objects.values_list(
+                             'id', 'shop__name', 'product__name', 'price', 'quantity')),
+    }
+
+
+def asgi_get(path, query_string=''):
+    """GET через ASGI-приложение проекта, как под uvicorn: (статус, тело ответа)"""
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(),
+             'headers': [(b'host', b'testserver')], 'server': ('testserver', 80), 'client': ('127.0.0.1', 0)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async_to_sync(get_asgi_application())(scope, receive, send)
+    return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+
+class CatalogTestCase(TestCase):
+    """Каталог из PRICE_LIST и покупатель с контактом и авторизованным клиентом API"""
+
+    def setUp(self):
+        # кэш ответов и сегменты индексов живут в памяти процесса, а версии и id в каждом тесте те же
+        catalog_cache.clear()
+        search_index.segments.clear()
+        facet_index.segments.clear()
+        self.shop = self.import_shop('supplier', PRICE_LIST)
+        self.offers = dict(ProductInfo.objects.values_list('product__name', 'id'))
+        self.xs_max, self.xr, self.case = (self.offers[item['name']] for item in PRICE_LIST['goods'])
+        self.buyer = User.objects.create(username='buyer')
+        self.contact = Buyer.objects.create(user=self.buyer, name='Иван', address='Москва', phone='+70000000000')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    @staticmethod
+    def import_shop(username, data):
+        supplier = User.objects.create(username=username, type=UserTypeChoices.SHOP)
+        return PriceListImporter(user_id=supplier.id, url=f'http://{username}.test/shop.yaml').run(
+            read_price_list(dump_price_list(data))).shop
+
+    def add_to_basket(self, *lines, client=None):
+        items = [{'product_info': product_info, 'quantity': quantity} for product_info, quantity in lines]
+        return (client or self.client).post('/api/v1/basket/', {'items': items}, format='json')
+
+    def basket(self, user=None):
+        return Order.objects.get(user=user or self.buyer, state=OrderStateChoices.BASKET)
+
+    def basket_lines(self, user=None):
+        return dict(OrderItem.objects.filter(order=self.basket(user)).values_list('product_info_id', 'quantity'))
+
+
+class ReadPriceListTests(SimpleTestCase):
+
+    def test_streams_goods_after_shop_and_categories(self):
+        data = read_price_list(dump_price_list(PRICE_LIST, sort_keys=False))
+        self.assertEqual(data['shop'], PRICE_LIST['shop'])
+        self.assertEqual(data['categories'], PRICE_LIST['categories'])
+        self.assertEqual(list(data['goods']), PRICE_LIST['goods'])
+
+    def test_accepts_goods_before_shop(self):
+        # yaml.dump() по умолчанию сортирует ключи: categories, goods, shop
+        data = read_price_list(dump_price_list(PRICE_LIST))
+        self.assertEqual(data['shop'], PRICE_LIST['shop'])
+        self.assertEqual(list(data['goods']), PRICE_LIST['goods'])
+
+    def test_price_list_without_goods(self):
+        data = read_price_list(dump_price_list({'shop': 'Связной', 'categories': []}))
+        self.assertEqual(list(data['goods']), [])
+
+    def test_reads_shop_name_only(self):
+        for sort_keys in (True, False):
+            with self.subTest(sort_keys=sort_keys):
+                self.assertEqual(read_shop_name(dump_price_list(PRICE_LIST, sort_keys=sort_keys)), PRICE_LIST['shop'])
+        with self.assertRaises(KeyError):
+            read_shop_name(dump_price_list({'categories': [], 'goods': []}))
+
+
+class RecoverImportJobsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='supplier', type=UserTypeChoices.SHOP)
+
+    def create_job(self, status, **fields):
+        job = ImportJob.objects.create(user=self.user, url='http://supplier.test/shop.yaml', status=status)
+        ImportJob.objects.filter(id=job.id).update(**fields)
+        return job
+
+    def test_fails_stale_running_and_requeues_stale_pending(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        running = self.create_job(ImportJobStatusChoices.RUNNING, started_at=long_ago, heartbeat_at=long_ago)
+        pending = self.create_job(ImportJobStatusChoices.PENDING, created_at=long_ago)
+        alive = self.create_job(ImportJobStatusChoices.RUNNING, started_at=long_ago, heartbeat_at=timezone.now())
+        fresh = self.create_job(ImportJobStatusChoices.PENDING)
+
+        executor = mock.Mock()
+        # отметки выполнения пишутся только в базах с параллельными писателями
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch('backend.jobs.get_executor', return_value=executor), \
+                self.assertLogs('backend.jobs', 'WARNING'):
+            recover_import_jobs()
+
+        statuses = dict(ImportJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[running.id], ImportJobStatusChoices.FAILED)
+        self.assertEqual(statuses[pending.id], ImportJobStatusChoices.PENDING)
+        self.assertEqual(statuses[alive.id], ImportJobStatusChoices.RUNNING)
+        self.assertEqual(statuses[fresh.id], ImportJobStatusChoices.PENDING)
+        self.assertEqual([call.args[1] for call in executor.submit.call_args_list], [pending.id])
+
+    def test_running_jobs_are_kept_on_sqlite(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        running = self.create_job(ImportJobStatusChoices.RUNNING, started_at=long_ago)
+        with mock.patch.object(connection, 'vendor', 'sqlite'), mock.patch('backend.jobs.get_executor'):
+            self.assertEqual(recover_import_jobs(), (0, []))
+        self.assertEqual(ImportJob.objects.get(id=running.id).status, ImportJobStatusChoices.RUNNING)
+
+    def test_command_runs_requeued_jobs(self):
+        pending = self.create_job(ImportJobStatusChoices.PENDING, created_at=timezone.now() - timedelta(hours=1))
+        output = io.StringIO()
+        with mock.patch('backend.jobs.run_import_job') as run_import_job, self.assertLogs('backend.jobs', 'WARNING'):
+            call_command('recover_import_jobs', stdout=output)
+        run_import_job.assert_called_once_with(pending.id)
+        self.assertIn('поставлено в очередь заново: 1', output.getvalue())
+
+
+class PriceListImporterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='supplier', type=UserTypeChoices.SHOP)
+        self.url = 'http://supplier.test/shop.yaml'
+
+    def run_import(self, data, mode=ImportModeChoices.REPLACE, **kwargs):
+        importer = PriceListImporter(user_id=self.user.id, url=self.url, mode=mode, **kwargs)
+        return importer.run(read_price_list(dump_price_list(data, sort_keys=False)))
+
+    def offer_ids(self):
+        return dict(ProductInfo.objects.values_list('product__name', 'id'))
+
+    def test_matches_row_by_row_import(self):
+        baseline_import(PRICE_LIST, self.user.id, self.url)
+        expected = catalog_snapshot()
+        Shop.objects.all().delete()
+        for model in (Category, Product, Parameter):
+            model.objects.all().delete()
+
+        for mode in ImportModeChoices.values:
+            with self.subTest(mode=mode):
+                result = self.run_import(PRICE_LIST, mode=mode, batch_size=2)
+                self.assertEqual(result.rows, len(PRICE_LIST['goods']))
+                self.assertEqual(catalog_snapshot(), expected)
+
+    def test_parameters_document_matches_parameter_rows(self):
+        self.run_import(PRICE_LIST)
+        for product_info in ProductInfo.objects.prefetch_related('product_parameters__parameter'):
+            self.assertEqual(product_info.parameters,
+                             {row.parameter.name: row.value for row in product_info.product_parameters.all()})
+
+    def test_reimport_reuses_names(self):
+        self.run_import(PRICE_LIST)
+        self.run_import(PRICE_LIST)
+        self.assertEqual(Product.objects.count(), len(PRICE_LIST['goods']))
+        self.assertEqual(Parameter.objects.count(), 3)
+        self.assertEqual(Category.objects.count(), len(PRICE_LIST['categories']))
+
+    def test_diff_sync_counts_and_keeps_ids(self):
+        self.run_import(PRICE_LIST, mode=ImportModeChoices.DIFF)
+        ids = self.offer_ids()
+        xs_max, xr, case = (item['name'] for item in PRICE_LIST['goods'])
+        basket = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=basket, product_info_id=ids[xr], quantity=1)
+
+        changed = copy.deepcopy(PRICE_LIST)
+        changed['goods'][0]['price'] = 99000
+        changed['goods'][1]['parameters']['Цвет'] = 'синий'
+        del changed['goods'][2]
+        changed['goods'].append({'id': 1, 'category': 15, 'name': 'Защитное стекло для iPhone XR', 'price': 990,
+                                 'quantity': 30, 'parameters': {}})
+        result = self.run_import(changed, mode=ImportModeChoices.DIFF)
+
+        self.assertEqual((result.created, result.updated, result.deleted), (1, 2, 1))
+        new_ids = self.offer_ids()
+        self.assertEqual(new_ids[xs_max], ids[xs_max])
+        self.assertEqual(new_ids[xr], ids[xr])
+        self.assertNotIn(case, new_ids)
+        self.assertEqual(ProductInfo.objects.get(id=ids[xs_max]).price, 99000)
+        self.assertEqual(ProductParameter.objects.get(product_info_id=ids[xr], parameter__name='Цвет').value, 'синий')
+        self.assertTrue(OrderItem.objects.filter(order=basket, product_info_id=ids[xr]).exists())
+
+    def test_diff_sync_of_same_price_list_changes_nothing(self):
+        self.run_import(PRICE_LIST, mode=ImportModeChoices.DIFF)
+        ids = self.offer_ids()
+        result = self.run_import(PRICE_LIST, mode=ImportModeChoices.DIFF)
+        self.assertEqual((result.created, result.updated, result.deleted), (0, 0, 0))
+        self.assertEqual(self.offer_ids(), ids)
+
+    def test_only_changing_import_bumps_versions(self):
+        self.run_import(PRICE_LIST, mode=ImportModeChoices.DIFF)
+        version = Shop.objects.get().version
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.run_import(PRICE_LIST, mode=ImportModeChoices.DIFF)
+        self.assertEqual((Shop.objects.get().version, callbacks), (version, []))
+
+        changed = copy.deepcopy(PRICE_LIST)
+        changed['goods'][0]['quantity'] = 1
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.run_import(changed, mode=ImportModeChoices.DIFF)
+        self.assertEqual((Shop.objects.get().version, len(callbacks)), (version + 1, 1))
+
+    def test_replace_recreates_offers(self):
+        self.run_import(PRICE_LIST)
+        ids = self.offer_ids()
+        result = self.run_import(PRICE_LIST)
+        self.assertEqual(result.created, len(PRICE_LIST['goods']))
+        self.assertTrue(set(ids.values()).isdisjoint(self.offer_ids().values()))
+
+    def test_prepared_names_are_not_inserted_during_import(self):
+        importer = PriceListImporter(user_id=self.user.id, url=self.url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            importer.prepare_names(read_price_list(dump_price_list(PRICE_LIST)))
+        self.assertEqual(Product.objects.count(), len(PRICE_LIST['goods']))
+        # новые названия видны в каталоге сразу, поэтому его версия меняется
+        self.assertEqual(len(callbacks), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            PriceListImporter(user_id=self.user.id, url=self.url).prepare_names(
+                read_price_list(dump_price_list(PRICE_LIST)))
+        self.assertEqual(callbacks, [])
+
+        with CaptureQueriesContext(connection) as queries:
+            importer.run(read_price_list(dump_price_list(PRICE_LIST)))
+        tables = [Category._meta.db_table, Product._meta.db_table, Parameter._meta.db_table]
+        self.assertFalse([query['sql'] for query in queries
+                          if any(f'INSERT INTO "{table}"' in query['sql'] for table in tables)])
+        self.assertEqual(ProductInfo.objects.count(), len(PRICE_LIST['goods']))
+
+
+class BasketViewTests(CatalogTestCase):
+
+    def test_add_merges_repeated_lines(self):
+        response = self.add_to_basket((self.xr, 1), (self.case, 2), (self.xr, 2))
+        self.assertEqual(response.json(), {'Status': 'Позиция(и) добавлены', 'created': 2, 'updated': 0})
+        response = self.add_to_basket((self.xr, 1))
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(self.basket_lines(), {self.xr: 4, self.case: 2})
+
+        response = self.client.get('/api/v1/basket/')
+        self.assertEqual(response.json()['total_price'], 4 * 65000 + 2 * 1490)
+
+    def test_basket_read_runs_constant_queries(self):
+        self.add_to_basket((self.xr, 1))
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.client.get('/api/v1/basket/').json()['items']), 1)
+        self.add_to_basket((self.case, 2), (self.xs_max, 1))
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/basket/').json()
+        self.assertEqual(len(response['items']), 3)
+        self.assertEqual(response['total_price'], 65000 + 2 * 1490 + 110000)
+
+    def test_add_is_all_or_nothing(self):
+        response = self.add_to_basket((self.xr, 1), (self.case, 51), (0, 1))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['not_found'], [0])
+        self.assertEqual(response.json()['insufficient'],
+                         [{'product_info': self.case, 'available': 50, 'requested': 51}])
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_update_and_delete_lines(self):
+        self.add_to_basket((self.xr, 1), (self.case, 1))
+        lines = dict(OrderItem.objects.values_list('product_info_id', 'id'))
+
+        response = self.client.put('/api/v1/basket/', {'items': [
+            {'id': lines[self.xr], 'quantity': 3}, {'id': lines[self.case], 'quantity': 51},
+            {'id': 0, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.json()['items'], {str(lines[self.xr]): 'updated',
+                                                    str(lines[self.case]): 'insufficient', '0': 'not_found'})
+        self.assertEqual(self.basket_lines(), {self.xr: 3, self.case: 1})
+
+        response = self.client.delete('/api/v1/basket/', {'items': f'{lines[self.case]},0,x'}, format='json')
+        self.assertEqual(response.json()['items'], {str(lines[self.case]): 'deleted', '0': 'not_found',
+                                                    'x': 'invalid'})
+        self.assertEqual(self.basket_lines(), {self.xr: 3})
+
+    def test_lines_of_placed_order_are_not_changed(self):
+        self.add_to_basket((self.xr, 1))
+        line = OrderItem.objects.get()
+        Order.objects.filter(id=line.order_id).update(state=OrderStateChoices.NEW)
+
+        response = self.client.delete('/api/v1/basket/', {'items': str(line.id)}, format='json')
+        self.assertEqual(response.json()['items'], {str(line.id): 'not_found'})
+        self.add_to_basket((self.xr, 2))
+        self.assertEqual(OrderItem.objects.get(id=line.id).quantity, 1)
+        self.assertNotEqual(self.basket().id, line.order_id)
+
+
+class CheckoutTests(CatalogTestCase):
+
+    def stock(self):
+        return dict(ProductInfo.objects.values_list('id', 'quantity'))
+
+    def checkout(self, user=None, client=None):
+        user = user or self.buyer
+        order, contact = self.basket(user), Buyer.objects.get(user=user)
+        return (client or self.client).post('/api/v1/order/', {'id': order.id, 'buyer': contact.id}, format='json')
+
+    def second_buyer(self):
+        user = User.objects.create(username='buyer2')
+        Buyer.objects.create(user=user, name='Пётр', address='Казань', phone='+70000000001')
+        client = APIClient()
+        client.force_authenticate(user)
+        return user, client
+
+    def test_checkout_reserves_stock_and_snapshots_order(self):
+        self.add_to_basket((self.xr, 2), (self.case, 3))
+        order_id = self.basket().id
+        response = self.checkout()
+        self.assertEqual(response.json(), {'Status': 'Заказ оформлен'})
+
+        stock = self.stock()
+        self.assertEqual((stock[self.xr], stock[self.case], stock[self.xs_max]), (7, 47, 14))
+        order = Order.objects.get(id=order_id)
+        self.assertEqual((order.state, order.buyer_id), (OrderStateChoices.NEW, self.contact.id))
+        self.assertEqual(order.total_price, 2 * 65000 + 3 * 1490)
+        self.assertEqual(set(OrderItem.objects.filter(order=order).values_list('price', 'shop_name')),
+                         {(65000, 'Связной'), (1490, 'Связной')})
+        shop_order = ShopOrder.objects.get(order=order)
+        self.assertEqual((shop_order.subtotal, len(shop_order.lines)), (order.total_price, 2))
+
+    def test_no_oversell_across_baskets(self):
+        other, client = self.second_buyer()
+        self.add_to_basket((self.xr, 6))
+        self.add_to_basket((self.xr, 6), client=client)
+
+        self.assertEqual(self.checkout().status_code, 200)
+        response = self.checkout(other, client)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['insufficient'], [{'product_info': self.xr, 'requested': 6, 'available': 3}])
+        self.assertEqual(self.stock()[self.xr], 3)
+
+    def test_insufficient_stock_changes_nothing(self):
+        self.add_to_basket((self.xr, 2), (self.case, 40))
+        basket = self.basket()
+        ProductInfo.objects.filter(id=self.case).update(quantity=10)
+        stock = self.stock()
+
+        with self.assertRaises(InsufficientStock) as error:
+            checkout_basket(self.buyer.id, basket.id, self.contact.id)
+        self.assertEqual(error.exception.lines, [{'product_info': self.case, 'requested': 40, 'available': 10}])
+        self.assertEqual(self.stock(), stock)
+        self.assertEqual(self.basket().id, basket.id)
+        self.assertFalse(ShopOrder.objects.exists())
+
+    def test_closed_shop_is_not_ordered(self):
+        self.add_to_basket((self.xr, 1))
+        Shop.objects.update(state=ShopStatusChoices.CLOSED)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['Error'], 'Магазин не принимает заказы')
+        self.assertEqual(response.json()['closed'], [{'product_info': self.xr, 'shop': self.shop.id}])
+        self.assertNotIn('insufficient', response.json())
+        self.assertEqual(self.stock()[self.xr], 9)
+
+
+class OrderHistoryTests(CatalogTestCase):
+
+    def place_order(self, *lines):
+        self.add_to_basket(*lines)
+        return checkout_basket(self.buyer.id, self.basket().id, self.contact.id)
+
+    def test_history_pages_newest_first_with_totals(self):
+        orders = [self.place_order((self.xr, 1)), self.place_order((self.case, 2), (self.xs_max, 1)),
+                  self.place_order((self.case, 1))]
+        first = self.client.get('/api/v1/order/', {'limit': 2}).json()
+        second = self.client.get(first['next']).json()
+        self.assertIsNone(second['next'])
+        history = first['results'] + second['results']
+        self.assertEqual([order['total_price'] for order in history], [1490, 2 * 1490 + 110000, 65000])
+        self.assertEqual([order.total_price for order in reversed(orders)], [1490, 2 * 1490 + 110000, 65000])
+        self.assertEqual({(item['product_name'], item['shop_name'], item['price'], item['quantity'])
+                          for item in history[1]['items']},
+                         {(PRICE_LIST['goods'][2]['name'], 'Связной', 1490, 2),
+                          (PRICE_LIST['goods'][0]['name'], 'Связной', 110000, 1)})
+
+    def test_history_queries_do_not_grow_with_orders(self):
+        self.place_order((self.xr, 1))
+        with CaptureQueriesContext(connection) as single:
+            self.client.get('/api/v1/order/')
+        for _ in range(3):
+            self.place_order((self.case, 1), (self.xs_max, 1))
+        with CaptureQueriesContext(connection) as several:
+            self.client.get('/api/v1/order/')
+        self.assertEqual(len(several), len(single))
+
+    def test_cursor_past_last_page_is_empty(self):
+        older = self.place_order((self.xr, 1))
+        self.place_order((self.case, 1))
+        first = self.client.get('/api/v1/order/', {'limit': 1}).json()
+        Order.objects.filter(id=older.id).delete()
+        response = self.client.get(first['next'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_no_orders(self):
+        response = self.client.get('/api/v1/order/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['Error'], 'Нет оформленных заказов')
+
+
+class ShopOrdersTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.supplier = APIClient()
+        self.supplier.force_authenticate(User.objects.get(username='supplier'))
+
+    def place_order(self, *lines):
+        self.add_to_basket(*lines)
+        return checkout_basket(self.buyer.id, self.basket().id, self.contact.id)
+
+    def test_list_runs_constant_queries(self):
+        for count in (1, 3):
+            while ShopOrder.objects.count() < count:
+                self.place_order((self.xr, 1), (self.case, 1))
+            with self.subTest(orders=count), self.assertNumQueries(1):
+                response = self.supplier.get('/api/v1/partner/orders/')
+            self.assertEqual(len(response.json()['results']), count)
+
+    def test_order_save_syncs_state(self):
+        order = self.place_order((self.xr, 1))
+        order.state = OrderStateChoices.CONFIRMED
+        order.save()
+        self.assertEqual(ShopOrder.objects.get(order=order).state, OrderStateChoices.CONFIRMED)
+        response = self.supplier.get('/api/v1/partner/orders/')
+        self.assertEqual(response.json()['results'][0]['state'], OrderStateChoices.CONFIRMED)
+
+
+class CheckoutStampTests(CatalogTestCase):
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_checkout_changes_only_stock_dependent_lists(self):
+        shop = Shop.objects.get()
+        urls = ['/api/v1/categories/', '/api/v1/shops/', '/api/v1/product/', '/api/v1/products/',
+                f'/api/v1/products/?shop={shop.id}']
+        before = {url: self.etag(url) for url in urls}
+        shop_version = shop.version
+
+        self.add_to_basket((self.xr, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout_basket(self.buyer.id, self.basket().id, self.contact.id)
+
+        after = {url: self.etag(url) for url in urls}
+        self.assertEqual([url for url in urls if after[url] != before[url]], urls[3:])
+        shop.refresh_from_db()
+        self.assertEqual(shop.version, shop_version)
+        self.assertEqual(shop.stock_version, 1)
+        response = self.client.get('/api/v1/products/', {'shop': shop.id})
+        quantities = {row['id']: row['quantity'] for row in response.json()['results']}
+        self.assertEqual(quantities[self.xr], 7)
+
+
+class ConstraintTests(CatalogTestCase):
+
+    def test_one_basket_per_user(self):
+        Order.objects.create(user=self.buyer)
+        Order.objects.create(user=self.buyer, state=OrderStateChoices.NEW)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(user=self.buyer)
+
+    def test_one_line_per_offer_in_order(self):
+        order = Order.objects.create(user=self.buyer)
+        OrderItem.objects.create(order=order, product_info_id=self.xr, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderItem.objects.create(order=order, product_info_id=self.xr, quantity=2)
+
+    def test_one_offer_per_shop_product(self):
+        offer = ProductInfo.objects.get(id=self.xr)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductInfo.objects.create(shop_id=offer.shop_id, product_id=offer.product_id, quantity=1, price=1)
+
+
+class CatalogPaginationTests(CatalogTestCase):
+
+    def test_cursor_pages_in_id_order(self):
+        cases = (
+            ('/api/v1/products/', 'id', ProductInfo.objects.order_by('id').values_list('id', flat=True)),
+            ('/api/v1/product/', 'name', Product.objects.order_by('id').values_list('name', flat=True)),
+            ('/api/v1/categories/', 'name', Category.objects.order_by('id').values_list('name', flat=True)),
+        )
+        for path, field, expected in cases:
+            with self.subTest(path=path):
+                page = self.client.get(path, {'limit': 1}).json()
+                self.assertIsNone(page['previous'])
+                rows = page['results']
+                while page['next']:
+                    self.assertIn('cursor=', page['next'])
+                    page = self.client.get(page['next']).json()
+                    self.assertIsNotNone(page['previous'])
+                    rows += page['results']
+                self.assertEqual([row[field] for row in rows], list(expected))
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/v1/products/', {'cursor': 'x'}).status_code, 404)
+
+
+class FastSerializationTests(CatalogTestCase):
+
+    def test_fast_output_matches_serializers(self):
+        self.add_to_basket((self.xr, 2), (self.case, 1))
+        checkout_basket(self.buyer.id, self.basket().id, self.contact.id)
+        supplier = APIClient()
+        supplier.force_authenticate(User.objects.get(username='supplier'))
+        requests = [(self.client, '/api/v1/products/', {}), (self.client, '/api/v1/products/', {'limit': 2}),
+                    (self.client, '/api/v1/products/', {'q': 'iphone'}), (self.client, '/api/v1/product/', {}),
+                    (supplier, '/api/v1/partner/orders/', {})]
+        for client, path, params in requests:
+            with self.subTest(path=path, params=params):
+                content = {}
+                for fast in (True, False):
+                    catalog_cache.clear()
+                    with override_settings(FAST_SERIALIZATION=fast):
+                        response = client.get(path, params)
+                    self.assertEqual(response.status_code, 200)
+                    content[fast] = response.content
+                self.assertEqual(content[True], content[False])
+                self.assertTrue(json.loads(content[True])['results'])
+
+    def test_parameters_are_read_from_document(self):
+        for fast in (True, False):
+            catalog_cache.clear()
+            with self.subTest(fast=fast), override_settings(FAST_SERIALIZATION=fast), \
+                    CaptureQueriesContext(connection) as queries:
+                results = self.client.get('/api/v1/products/').json()['results']
+                offer = next(row for row in results if row['id'] == self.xr)
+                self.assertEqual(offer['parameters'],
+                                 {'Диагональ (дюйм)': '6.1', 'Разрешение (пикс)': '1792x828', 'Цвет': 'красный'})
+                self.assertFalse([query for query in queries.captured_queries
+                                  if ProductParameter._meta.db_table in query['sql']])
+
+
+class SearchTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.second_shop = self.import_shop('supplier2', SECOND_PRICE_LIST)
+        self.xr_second, self.cable = ProductInfo.objects.filter(shop=self.second_shop).order_by('id').values_list(
+            'id', flat=True)
+
+    def search(self, **params):
+        response = self.client.get('/api/v1/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def found(self, **params):
+        return [row['id'] for row in self.search(**params)['results']]
+
+    def test_exact_word_ranks_above_prefix(self):
+        self.assertEqual(self.found(q='x'), [self.cable, self.xs_max, self.xr, self.case, self.xr_second])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.found(q='iphone красн'), [self.xr, self.xr_second])
+        self.assertEqual(self.found(q='iphone синий'), [])
+
+    def test_cursor_pages_follow_ranking(self):
+        first = self.search(q='iphone', limit=2)
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertIsNone(second['next'])
+        self.assertEqual([row['id'] for row in first['results'] + second['results']],
+                         [self.xs_max, self.xr, self.case, self.xr_second])
+
+    def test_search_with_shop_and_category_filters(self):
+        self.assertEqual(self.found(q='iphone', shop=self.second_shop.id), [self.xr_second])
+        accessories = Category.objects.get(name='Аксессуары')
+        Product.objects.filter(product_infos__id__in=[self.case, self.cable]).update(category=accessories)
+        self.assertEqual(self.found(q='iphone', product__category=accessories.id), [self.case])
+
+    def test_query_without_words_pages_in_id_order(self):
+        first = self.search(q='!', limit=3)
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['id'] for row in first['results'] + second['results']],
+                         sorted(ProductInfo.objects.values_list('id', flat=True)))
+
+
+class FacetTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.second_shop = self.import_shop('supplier2', SECOND_PRICE_LIST)
+        self.xr_second, self.cable = ProductInfo.objects.filter(shop=self.second_shop).order_by('id').values_list(
+            'id', flat=True)
+
+    def products(self, *conditions, **params):
+        response = self.client.get('/api/v1/products/', {'param': list(conditions), **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_are_disjunctive(self):
+        response = self.products('Цвет:красный', facets='1')
+        self.assertEqual([row['id'] for row in response['results']], [self.xr, self.xr_second])
+        # выбор цвета не скрывает остальные цвета, а другие параметры считаются по выбранным позициям
+        self.assertEqual(response['facets'], {
+            'Диагональ (дюйм)': {'6.1': 2},
+            'Разрешение (пикс)': {'1792x828': 2},
+            'Цвет': {'красный': 2, 'золотистый': 1, 'прозрачный': 1, 'черный': 1},
+        })
+
+    def test_values_of_one_parameter_are_combined(self):
+        response = self.products('Цвет:красный', 'Цвет:черный', 'Диагональ (дюйм):6.1')
+        self.assertEqual([row['id'] for row in response['results']], [self.xr, self.xr_second])
+
+    def test_parameter_filter_with_shop(self):
+        response = self.products('Цвет:красный', shop=self.second_shop.id, facets='1')
+        self.assertEqual([row['id'] for row in response['results']], [self.xr_second])
+        self.assertEqual(response['facets']['Цвет'], {'красный': 1, 'черный': 1})
+
+    def test_counts_follow_category_filter(self):
+        accessories = Category.objects.get(name='Аксессуары')
+        Product.objects.filter(product_infos__id__in=[self.case, self.cable]).update(category=accessories)
+        response = self.products(facets='1', product__category=accessories.id)
+        self.assertEqual([row['id'] for row in response['results']], [self.case, self.cable])
+        self.assertEqual(response['facets'], {'Цвет': {'прозрачный': 1, 'черный': 1}})
+
+    def test_closed_shop_is_not_counted(self):
+        Shop.objects.filter(id=self.second_shop.id).update(state=ShopStatusChoices.CLOSED)
+        response = self.products(facets='1')
+        self.assertEqual(response['facets']['Цвет'], {'золотистый': 1, 'красный': 1, 'прозрачный': 1})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                           'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                    'LOCATION': 'auth-tests'}},
+                   AUTH_TOKEN_CACHE_ALIAS='auth')
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        caches['auth'].clear()
+        self.user = User.objects.create(username='buyer')
+        self.token = Token.objects.create(user=self.user)
+        self.authentication = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.authentication.authenticate_credentials(self.token.key)
+
+    def test_cached_user_is_reused(self):
+        self.assertEqual(self.authenticate()[0].id, self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate()[0].id, self.user.id)
+
+    def test_deactivation_drops_cached_user(self):
+        self.authenticate()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_reset_in_another_process_is_seen(self):
+        self.authenticate()
+        # другой процесс заблокировал пользователя и опубликовал отметку токена
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        caches['auth'].set(token_stamp_key(self.token.key), 'reset')
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_token_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class StreamingListTests(CatalogTestCase):
+
+    def test_streams_all_rows(self):
+        response = self.client.get('/api/v1/products/', {'stream': '1'})
+        self.assertEqual(response.status_code, 200)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['product']['name'] for row in rows], [item['name'] for item in PRICE_LIST['goods']])
+        self.assertEqual(rows, self.client.get('/api/v1/products/').json()['results'])
+
+    def test_invalid_filter_is_rejected_before_streaming(self):
+        response = self.client.get('/api/v1/products/', {'stream': '1', 'shop': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+
+    def test_asgi_returns_paginated_list(self):
+        for path in ('/api/v1/products/', '/api/v1/product/'):
+            with self.subTest(path=path):
+                status, body = asgi_get(path, 'stream=1')
+                self.assertEqual(status, 200)
+                self.assertEqual(json.loads(body), self.client.get(path).json())
+
+
+class SupplierHandler(BaseHTTPRequestHandler):
+    """Поставщик для тестов загрузки: /etag, /plain, /gzip, /chunked, /slow, /missing"""
+    body = yaml.dump(PRICE_LIST, allow_unicode=True, sort_keys=False).encode('utf-8')
+    etag = '"v1"'
+
+    def do_GET(self):
+        if self.path == '/etag' and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.path in ('/chunked', '/slow'):
+            self.send_response(200)
+            self.end_headers()
+            try:
+                for _ in range(10):
+                    self.wfile.write(b'#' * 64 * 1024 + b'\n')
+                    self.wfile.flush()
+                    if self.path == '/slow':
+                        time.sleep(0.1)
+            except ConnectionError:
+                pass  # клиент прервал загрузку по ограничению
+            return
+
+        if self.path == '/missing':
+            self.send_error(404)
+            return
+
+        body = gzip.compress(self.body) if self.path == '/gzip' else self.body
+        self.send_response(200)
+        if self.path == '/etag':
+            self.send_header('ETag', self.etag)
+        if self.path == '/gzip':
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SupplierServerMixin:
+    """Локальный HTTP-сервер поставщика с SupplierHandler на время тестов класса"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), SupplierHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.supplier = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+
+class FetchPriceListTests(SupplierServerMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='supplier', type=UserTypeChoices.SHOP)
+
+    def fetch(self, path, shop=None):
+        with fetch_price_list(f'{self.supplier}{path}', shop) as download:
+            return download, download.stream.read()
+
+    def test_downloads_and_remembers_validators(self):
+        download, content = self.fetch('/etag')
+        self.assertFalse(download.not_modified)
+        self.assertEqual(content, SupplierHandler.body)
+        self.assertEqual(download.validators(), {'price_etag': SupplierHandler.etag, 'price_last_modified': '',
+                                                 'price_hash': hashlib.sha256(SupplierHandler.body).hexdigest()})
+
+    def test_not_modified_is_skipped(self):
+        shop = Shop(name='Связной', price_etag=SupplierHandler.etag)
+        download, content = self.fetch('/etag', shop)
+        self.assertTrue(download.not_modified)
+        self.assertEqual(content, b'')
+        self.assertTrue(download.is_unchanged(shop))
+
+    def test_same_content_hash_is_skipped(self):
+        shop = Shop(name='Связной', price_hash=hashlib.sha256(SupplierHandler.body).hexdigest())
+        download, _ = self.fetch('/plain', shop)
+        self.assertFalse(download.not_modified)
+        self.assertTrue(download.is_unchanged(shop))
+        shop.price_hash = hashlib.sha256(b'old price list').hexdigest()
+        self.assertFalse(download.is_unchanged(shop))
+
+    def test_gzip_body_is_decompressed(self):
+        download, content = self.fetch('/gzip')
+        self.assertEqual(content, SupplierHandler.body)
+        self.assertEqual(download.size, len(SupplierHandler.body))
+
+    def test_size_limit(self):
+        with override_settings(SUPPLIER_MAX_SIZE=100):
+            # размер известен заранее из Content-Length
+            with self.assertRaisesMessage(SupplierFetchError, '100 байт'):
+                self.fetch('/plain')
+            # и проверяется по мере чтения тела без Content-Length
+            with self.assertRaisesMessage(SupplierFetchError, '100 байт'):
+                self.fetch('/chunked')
+
+    def test_gzip_size_limit_counts_decompressed_bytes(self):
+        with override_settings(SUPPLIER_MAX_SIZE=len(SupplierHandler.body) - 1):
+            with self.assertRaises(SupplierFetchError):
+                self.fetch('/gzip')
+
+    @override_settings(SUPPLIER_FETCH_MAX_TIME=0.3)
+    def test_time_limit(self):
+        with self.assertRaisesMessage(SupplierFetchError, 'Превышено время загрузки'):
+            self.fetch('/slow')
+
+    def test_unchanged_price_list_is_not_imported_again(self):
+        job = ImportJob.objects.create(user=self.user, url=f'{self.supplier}/etag')
+        result = import_from_url(job)
+        self.assertEqual((result.unchanged, result.created), (False, len(PRICE_LIST['goods'])))
+        shop = Shop.objects.get()
+        self.assertEqual(shop.price_etag, SupplierHandler.etag)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = import_from_url(job)
+        self.assertTrue(result.unchanged)
+        self.assertEqual(result.rows, 0)
+        self.assertFalse([query['sql'] for query in queries if 'backend_productinfo' in query['sql']])
+
+    def test_replace_job_always_imports(self):
+        import_from_url(ImportJob.objects.create(user=self.user, url=f'{self.supplier}/etag'))
+        # без условных заголовков поставщик отдаёт прайс целиком, а не 304
+        job = ImportJob.objects.create(user=self.user, url=f'{self.supplier}/etag', mode=ImportModeChoices.REPLACE)
+        result = import_from_url(job)
+        self.assertFalse(result.unchanged)
+        self.assertEqual(result.created, len(PRICE_LIST['goods']))
+
+
+class AsyncViewTests(SupplierServerMixin, TransactionTestCase):
+    """Асинхронные представления: их запросы к базе идут из других потоков, поэтому данные коммитятся"""
+
+    def setUp(self):
+        self.supplier_user = User.objects.create(username='supplier', type=UserTypeChoices.SHOP)
+        self.token = Token.objects.create(user=self.supplier_user)
+        catalog_cache.clear()
+
+    def post_update(self, body, user=None):
+        """POST асинхронного обновления прайса с ожиданием фоновой загрузки и импорта"""
+        token = self.token if user is None else Token.objects.get_or_create(user=user)[0]
+        executor = ThreadPoolExecutor(max_workers=1)
+
+        async def post():
+            response = await self.async_client.post('/api/v1/async/partner/update/', body,
+                                                    content_type='application/json',
+                                                    authorization=f'Token {token.key}')
+            await wait_for_downloads()
+            return response
+
+        with mock.patch('backend.async_views.get_executor', return_value=executor):
+            response = async_to_sync(post)()
+        executor.shutdown(wait=True)
+        return response
+
+    def job_status(self, job_id):
+        client = APIClient()
+        client.force_authenticate(self.supplier_user)
+        return client.get(f'/api/v1/partner/update/{job_id}/').json()
+
+    def test_catalog_reads(self):
+        PriceListImporter(user_id=self.supplier_user.id, url=f'{self.supplier}/plain').run(
+            read_price_list(dump_price_list(PRICE_LIST)))
+
+        async def get(path, **params):
+            response = await self.async_client.get(path, params)
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        names = [item['name'] for item in PRICE_LIST['goods']]
+        for params in ({}, {'stream': '1'}):
+            with self.subTest(params=params):
+                products = async_to_sync(get)('/api/v1/async/products/', **params)
+                self.assertEqual([row['product']['name'] for row in products['results']], names)
+        self.assertEqual([row['name'] for row in async_to_sync(get)('/api/v1/async/shops/')['results']],
+                         [PRICE_LIST['shop']])
+
+    def test_update_answers_with_job_and_imports_in_background(self):
+        response = self.post_update({'url': f'{self.supplier}/plain'})
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.json()['Status'])
+        job = self.job_status(response.json()['job'])
+        self.assertEqual((job['status'], job['created']), (ImportJobStatusChoices.DONE, len(PRICE_LIST['goods'])))
+        self.assertEqual(ProductInfo.objects.filter(shop__user=self.supplier_user).count(), len(PRICE_LIST['goods']))
+
+    def test_failed_download_is_reported_by_job(self):
+        response = self.post_update({'url': f'{self.supplier}/missing'})
+        self.assertEqual(response.status_code, 202)
+        job = self.job_status(response.json()['job'])
+        self.assertEqual(job['status'], ImportJobStatusChoices.FAILED)
+        self.assertIn('404', job['error'])
+
+    def test_buyer_is_rejected(self):
+        response = self.post_update({'url': f'{self.supplier}/plain'}, user=User.objects.create(username='buyer'))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_bad_body_is_rejected(self):
+        for body in ([], 'x', '{'):
+            with self.subTest(body=body):
+                response = self.post_update(body if body == '{' else json.dumps(body))
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImportJob.objects.exists())
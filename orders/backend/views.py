@@ -1,6 +1,8 @@
-import requests
-import yaml
 from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import DatabaseError, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
 from django.http import JsonResponse
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import ListAPIView
@@ -8,12 +10,58 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 
-from backend.models import Product, Shop, Category, ProductInfo, Order, OrderItem, Buyer, ProductParameter, Parameter
+from backend.models import Product, Shop, Category, ProductInfo, Order, OrderItem, Buyer, ImportJob, \
+    ImportModeChoices, OrderStateChoices, ShopStatusChoices, ShopOrder
 from backend.serialaizers import ProductSerializer, ShopSerializer, ShopStatusSerializer, ProductInfoSerializer, \
-    OrderItemSerializer, BuyerSerializer, CategorySerializer, OrderSerializer, UserSerializer
+    OrderItemSerializer, BuyerSerializer, CategorySerializer, UserSerializer, ImportJobSerializer, \
+    OrderHistoryItemSerializer, ShopOrderSerializer, PRODUCT_ROW, PRODUCT_INFO_ROW, SHOP_ORDER_ROW
 from backend.permission import IsAuthorPermissions, IsShopPermissions
+from backend.cache import CatalogCacheMixin, shop_changed
+from backend.checkout import CheckoutError, InsufficientStock, ShopClosed, checkout_basket
+from backend.jobs import enqueue_import
+from backend.rendering import FastListMixin, StreamingListMixin
+from backend.pagination import IdCursorPagination, OrderCursorPagination, SearchPagination
+from backend.search import ProductSearchFilter
+from backend.facets import ParameterFilter
+
+
+
+def split_ids(items):
+    """Разобрать строку id через запятую: (список id, {некорректный id: 'invalid'})"""
+    ids, outcome = [], {}
+    for item in items.split(','):
+        item = item.strip()
+        if item.isdigit():
+            ids.append(int(item))
+        else:
+            outcome[item] = 'invalid'
+    return ids, outcome
+
+
+def get_import_params(data):
+    """Ссылка на прайс и режим импорта из запроса обновления: (url, mode, текст ошибки или None)"""
+    url = data.get('url')
+    mode = data.get('mode', ImportModeChoices.DIFF)
+    if mode not in ImportModeChoices.values:
+        return url, mode, 'Неизвестный режим импорта'
+    if not url:
+        return url, mode, 'Не указаны все необходимые данные'
+    try:
+        URLValidator()(url)
+    except ValidationError:
+        return url, mode, 'Некорректная ссылка на прайс-лист'
+    return url, mode, None
 
 
+def lock_basket(user_id):
+    """Корзина пользователя, заблокированная до конца транзакции, или None.
+
+    Оформление заказа блокирует ту же строку. Если заказ оформлен, пока запрос
+    ждал блокировку, условие state='basket' перепроверяется после его коммита
+    и строка не находится, так что позиции не попадут в оформленный заказ.
+    """
+    return Order.objects.select_for_update().filter(user_id=user_id, state=OrderStateChoices.BASKET).first()
+
 
 class RegisterAccountView(APIView):
     """Класс для регистрации"""
@@ -97,20 +145,20 @@ class BuyerView(APIView):
     """Удалить адрес (контакт)"""
     def delete(self, request, *args, **kwargs):
         items = request.data.get('items')
-        if items:
-            items = items.split(',')
-            for item_id in items:
-                if item_id.isdigit():
-                    try:
-                        Buyer.objects.filter(id=item_id).delete()[0]
-                    except:
-                        return JsonResponse({'Status': False, 'Error': 'Ошибка удаления из БД'})
-                else:
-                    return JsonResponse({'Status': False, 'Error': 'Введите корректный номер заказа'}, status=403)
-            return JsonResponse({'Status': 'Адрес(а) удалены'})
-        else:
+        if not items or type(items) != str:
             return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
 
+        ids, outcome = split_ids(items)
+        try:
+            with transaction.atomic():
+                contacts = Buyer.objects.filter(user_id=request.user.id, id__in=ids)
+                deleted = set(contacts.values_list('id', flat=True))
+                contacts.filter(id__in=deleted).delete()
+        except DatabaseError:
+            return JsonResponse({'Status': False, 'Error': 'Ошибка удаления из БД'})
+        outcome.update({str(item_id): 'deleted' if item_id in deleted else 'not_found' for item_id in ids})
+        return JsonResponse({'Status': 'Адрес(а) удалены', 'items': outcome})
+
     """Изменить адрес (контакт)"""
     def put(self, request, *args, **kwargs):
         if type(request.data.get('id')) == int:
@@ -127,41 +175,53 @@ class BuyerView(APIView):
 
 
 
-class CategoryView(APIView):
+class CategoryView(CatalogCacheMixin, ListAPIView):
     """Класс для просмотра списка категорий"""
-
-    def get(self, request, *args, **kwargs):
-        queryset = Category.objects.all()
-        serializer = CategorySerializer(queryset, many=True)
-        return Response(serializer.data)
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+    pagination_class = IdCursorPagination
 
 
-class ProductView(APIView):
+class ProductView(StreamingListMixin, CatalogCacheMixin, FastListMixin, ListAPIView):
     """Класс для просмотра списка товаров"""
-
-    def get(self, request, *args, **kwargs):
-        queryset = Product.objects.all()
-        serializer = ProductSerializer(queryset, many=True)
-        return Response(serializer.data)
+    queryset = Product.objects.select_related('category')
+    serializer_class = ProductSerializer
+    row_mapper = PRODUCT_ROW
+    pagination_class = IdCursorPagination
 
 
-class ShopView(APIView):
+class ShopView(CatalogCacheMixin, ListAPIView):
     """Класс для просмотра списка магазинов"""
-
-    def get(self, request, *args, **kwargs):
-        queryset = Shop.objects.filter(state='OPEN')
-        serializer = ShopSerializer(queryset, many=True)
-        return Response(serializer.data)
+    queryset = Shop.objects.filter(state='OPEN')
+    serializer_class = ShopSerializer
+    pagination_class = IdCursorPagination
 
 
-class ProductInfoView(ListAPIView):
+class ProductInfoView(StreamingListMixin, CatalogCacheMixin, FastListMixin, ListAPIView):
     """Класс для поиска товаров"""
-    queryset = ProductInfo.objects.filter(shop__state='OPEN').select_related(
-            'shop', 'product__category').distinct()
+    queryset = ProductInfo.objects.filter(shop__state='OPEN').select_related('shop', 'product__category')
     serializer_class = ProductInfoSerializer
-    filter_backends = [DjangoFilterBackend]
+    row_mapper = PRODUCT_INFO_ROW
+    pagination_class = IdCursorPagination
+    shop_filter_param = 'shop'
+    stock_dependent = True
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ParameterFilter]
     filterset_fields = ['shop', 'product__category']
 
+    @property
+    def paginator(self):
+        """Результаты поиска ?q= выводятся в порядке релевантности, а не по id"""
+        if not hasattr(self, '_paginator') and self.request.query_params.get(ProductSearchFilter.search_param):
+            self._paginator = SearchPagination()
+        return super().paginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        facets = getattr(self.request, 'facets', None)
+        if facets is not None:
+            response.data['facets'] = facets
+        return response
+
 
 class BasketView(APIView):
     """Класс для работы с корзиной пользователя"""
@@ -170,35 +230,64 @@ class BasketView(APIView):
     """Добавить позицию в заказ"""
     def post(self, request, *args, **kwargs):
         items = request.data.get('items')
-        if items:
-            basket = Order.objects.get_or_create(user_id=request.user.id, state='basket')[0]
-            for item in items:
-                if type(item['product_info']) == int and type(item['quantity']) == int:
-                    try:
-                        OrderItem.objects.create(order_id=basket.id, product_info_id=item['product_info'],
-                                                 quantity=item['quantity'])
-                    except:
-                        return JsonResponse({'Status': False, 'Error': 'Ошибка записи в БД'})
-
-                else:
-                    return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
-            return JsonResponse({'Status': 'Позиция(и) добавлены'})
-        else:
+        if not items or type(items) != list:
             return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
 
+        # повторы одной позиции в запросе складываются
+        quantities = {}
+        for item in items:
+            if type(item) != dict or type(item.get('product_info')) != int or type(item.get('quantity')) != int \
+                    or item['quantity'] < 1:
+                return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
+            quantities[item['product_info']] = quantities.get(item['product_info'], 0) + item['quantity']
+
+        try:
+            with transaction.atomic():
+                # см. lock_basket: строки не добавляются в заказ, оформляемый параллельно
+                basket = Order.objects.select_for_update().get_or_create(user_id=request.user.id,
+                                                                         state=OrderStateChoices.BASKET)[0]
+                # позиции, остатки и уже лежащие в корзине строки - одним запросом
+                lines = OrderItem.objects.filter(order_id=basket.id, product_info_id=OuterRef('id'))
+                offers = {offer['id']: offer for offer in ProductInfo.objects.filter(
+                    id__in=quantities, shop__state=ShopStatusChoices.OPEN).annotate(
+                    line_id=Subquery(lines.values('id')[:1]),
+                    line_quantity=Subquery(lines.values('quantity')[:1])).values(
+                    'id', 'quantity', 'line_id', 'line_quantity')}
+
+                not_found = sorted(set(quantities) - set(offers))
+                insufficient = [{'product_info': product_info_id, 'available': offer['quantity'],
+                                 'requested': quantities[product_info_id] + (offer['line_quantity'] or 0)}
+                                for product_info_id, offer in sorted(offers.items())
+                                if quantities[product_info_id] + (offer['line_quantity'] or 0) > offer['quantity']]
+                if not_found or insufficient:
+                    return JsonResponse({'Status': False, 'Error': 'Позиции недоступны для заказа',
+                                         'not_found': not_found, 'insufficient': insufficient}, status=403)
+
+                to_create = [OrderItem(order_id=basket.id, product_info_id=product_info_id, quantity=quantity)
+                             for product_info_id, quantity in quantities.items()
+                             if offers[product_info_id]['line_id'] is None]
+                to_update = [OrderItem(id=offers[product_info_id]['line_id'],
+                                       quantity=offers[product_info_id]['line_quantity'] + quantity)
+                             for product_info_id, quantity in quantities.items()
+                             if offers[product_info_id]['line_id'] is not None]
+                OrderItem.objects.bulk_create(to_create)
+                OrderItem.objects.bulk_update(to_update, ['quantity'])
+        except DatabaseError:
+            return JsonResponse({'Status': False, 'Error': 'Ошибка записи в БД'})
+        return JsonResponse({'Status': 'Позиция(и) добавлены', 'created': len(to_create), 'updated': len(to_update)})
+
 
     """Посмотреть цену заказа"""
     def get(self, request, *args, **kwargs):
-        queryset = Order.objects.filter(user_id=request.user.id, state='basket').distinct()
-        if queryset:
-            basket = queryset[0]
-            order_items = OrderItem.objects.filter(order_id=basket.id).distinct()
+        # Order.total_price заполняется при оформлении, сумма корзины считается по текущим ценам
+        basket = Order.objects.filter(user_id=request.user.id, state='basket').annotate(
+            basket_total=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).first()
+        if basket:
+            order_items = OrderItem.objects.filter(order_id=basket.id).select_related(
+                'product_info__product__category', 'product_info__shop')
             if order_items:
-                total_price = 0
-                for item in order_items:
-                    total_price += item.quantity * item.product_info.price
                 serializer = OrderItemSerializer(order_items, many=True)
-                return JsonResponse({'items': serializer.data, 'total_price': total_price})
+                return JsonResponse({'items': serializer.data, 'total_price': basket.basket_total})
             else:
                 return JsonResponse({'Status': False, 'Error': 'Добавьте позиции в заказ'}, status=403)
         else:
@@ -208,41 +297,56 @@ class BasketView(APIView):
     """Удалить позицию из заказа"""
     def delete(self, request, *args, **kwargs):
         items = request.data.get('items')
-        queryset = Order.objects.get(user_id=request.user.id, state='basket')
-        if items and queryset:
-            items = items.split(',')
-            for item in items:
-                if item.isdigit():
-                    try:
-                        OrderItem.objects.filter(order_id=queryset.id, id=item).delete()
-                    except:
-                        return JsonResponse({'Status': False, 'Error': 'Ошибка удаления из БД'})
-                else:
-                    JsonResponse({'Status': False, 'Error': 'Введите корректный номер заказа'}, status=403)
-            return JsonResponse({'Status': 'Позиция(и) удалены'})
-        else:
+        if not items or type(items) != str:
             return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
 
+        ids, outcome = split_ids(items)
+        try:
+            with transaction.atomic():
+                basket = lock_basket(request.user.id)
+                deleted = set(OrderItem.objects.filter(order_id=basket.id, id__in=ids).values_list(
+                    'id', flat=True)) if basket else set()
+                OrderItem.objects.filter(id__in=deleted).delete()
+        except DatabaseError:
+            return JsonResponse({'Status': False, 'Error': 'Ошибка удаления из БД'})
+        outcome.update({str(item_id): 'deleted' if item_id in deleted else 'not_found' for item_id in ids})
+        return JsonResponse({'Status': 'Позиция(и) удалены', 'items': outcome})
+
 
     """Изменить количество товара в позиции"""
     def put(self, request, *args, **kwargs):
         items = request.data.get('items')
-        queryset_order = Order.objects.get(user_id=request.user.id, state='basket')
-        if items and queryset_order:
-            for item in items:
-                if type(item['id']) == int and type(item['quantity']) == int:
-                    try:
-                        OrderItem.objects.filter(order_id=queryset_order.id, id=item['id']).update(
-                            quantity=item['quantity'])
-
-                    except:
-                        return JsonResponse({'Status': False, 'Error': 'Ошибка записи в БД'})
-                else:
-                    return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
-            return JsonResponse({'Status': 'Позиция(и) изменены'})
-        else:
+        if not items or type(items) != list:
             return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
 
+        # при повторе строки в запросе побеждает последнее значение
+        quantities = {}
+        for item in items:
+            if type(item) != dict or type(item.get('id')) != int or type(item.get('quantity')) != int \
+                    or item['quantity'] < 1:
+                return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые данные'}, status=403)
+            quantities[item['id']] = item['quantity']
+
+        outcome = {}
+        try:
+            with transaction.atomic():
+                basket = lock_basket(request.user.id)
+                available = dict(OrderItem.objects.filter(order_id=basket.id, id__in=quantities).values_list(
+                    'id', 'product_info__quantity')) if basket else {}
+                to_update = []
+                for item_id, quantity in quantities.items():
+                    if item_id not in available:
+                        outcome[str(item_id)] = 'not_found'
+                    elif quantity > available[item_id]:
+                        outcome[str(item_id)] = 'insufficient'
+                    else:
+                        to_update.append(OrderItem(id=item_id, quantity=quantity))
+                        outcome[str(item_id)] = 'updated'
+                OrderItem.objects.bulk_update(to_update, ['quantity'])
+        except DatabaseError:
+            return JsonResponse({'Status': False, 'Error': 'Ошибка записи в БД'})
+        return JsonResponse({'Status': 'Позиция(и) изменены', 'items': outcome})
+
 
 
 class OrderView(APIView):
@@ -253,37 +357,32 @@ class OrderView(APIView):
     def post(self, request, *args, **kwargs):
         if type(request.data.get('id')) == int and type(request.data.get('buyer')) == int:
             try:
-                queryset = Order.objects.filter(user_id=request.user.id, id=request.data['id']).update(
-                    buyer_id=request.data['buyer'],
-                    state='new')
-            except:
+                checkout_basket(request.user.id, request.data['id'], request.data['buyer'])
+            except InsufficientStock as error:
+                return JsonResponse({'Status': False, 'Error': str(error), 'insufficient': error.lines}, status=403)
+            except ShopClosed as error:
+                return JsonResponse({'Status': False, 'Error': str(error), 'closed': error.lines}, status=403)
+            except CheckoutError as error:
+                return JsonResponse({'Status': False, 'Error': str(error)}, status=403)
+            except DatabaseError:
                 return JsonResponse({'Status': False, 'Error': 'Ошибка записи в БД'})
-            else:
-                if queryset > 0:
-                    return JsonResponse({'Status': 'Заказ оформлен'})
-                else:
-                    return JsonResponse({'Status': 'Не указаны все необходимые аргументы'})
+            return JsonResponse({'Status': 'Заказ оформлен'})
         else:
             return JsonResponse({'Status': False, 'Error': 'Не указаны все необходимые аргументы'})
 
     """Показать оформленные заказы"""
     def get(self, request, *args, **kwargs):
-        orders = Order.objects.filter(user_id=request.user.id).exclude(state='basket').distinct()
-        if orders:
-            list_orders = []
-            for order in orders:
-                order_items = OrderItem.objects.filter(order_id=order.id).distinct()
-                if order_items:
-                    total_price = 0
-                    for item in order_items:
-                        total_price += item.quantity * item.product_info.price
-                    serializer = OrderItemSerializer(order_items, many=True)
-                    list_orders.append({'items': serializer.data, 'total_price': total_price})
-                else:
-                    JsonResponse({'Status': False, 'Error': 'В одном из заказов удалены все позиции'}, status=403)
-            return Response(list_orders)
+        orders = Order.objects.filter(user_id=request.user.id, total_price__isnull=False).exclude(
+            state='basket').prefetch_related('order_items')
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        # за последней страницей - пустая страница, а не ошибка
+        if page or request.query_params.get(paginator.cursor_query_param):
+            list_orders = [{'items': OrderHistoryItemSerializer(order.order_items.all(), many=True).data,
+                            'total_price': order.total_price} for order in page]
+            return paginator.get_paginated_response(list_orders)
         else:
-            JsonResponse({'Status': False, 'Error': 'Нет оформленных заказов'}, status=403)
+            return JsonResponse({'Status': False, 'Error': 'Нет оформленных заказов'}, status=403)
 
 
 class ShopStatusView(APIView):
@@ -307,6 +406,7 @@ class ShopStatusView(APIView):
                     return JsonResponse({'Status': False, 'Errors': str(error)})
                 else:
                     if queryset > 0:
+                        shop_changed(user_id=request.user.id)
                         return Response(serializer.data)
                     else:
                         return JsonResponse({'Status': False, 'Errors': 'Нет привязанных к профилю магазинов'})
@@ -314,15 +414,15 @@ class ShopStatusView(APIView):
             return Response(serializer.errors)
 
 
-class ShopOrdersView(APIView):
+class ShopOrdersView(FastListMixin, ListAPIView):
     """Класс для получения заказов поставщиками"""
     permission_classes = [IsShopPermissions]
+    serializer_class = ShopOrderSerializer
+    row_mapper = SHOP_ORDER_ROW
+    pagination_class = OrderCursorPagination
 
-    def get(self, request, *args, **kwargs):
-        queryset = Order.objects.filter(order_items__product_info__shop__user_id=request.user.id).exclude(
-            state='basket').prefetch_related('order_items__product_info__shop').distinct()
-        serializer = OrderSerializer(queryset, many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        return ShopOrder.objects.filter(shop__user_id=self.request.user.id)
 
 
 class ShopUpdateView(APIView):
@@ -332,33 +432,21 @@ class ShopUpdateView(APIView):
     def post(self, request, *args, **kwargs):
         # with open('C:\python\python-final-diplom\data\shop1.yaml', encoding="utf-8") as file:
         #     data = yaml.full_load(file)
-        url = request.data.get('url')
-        if url:
-            stream = requests.get(url).content
-            data = yaml.load(stream, Loader=yaml.FullLoader)
-
-            shop = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id, url=url)[0]
-            for category_data in data['categories']:
-                category = Category.objects.get_or_create(name=category_data['name'])[0]
-                category.shops.add(shop.id)
-                category.save()
-            ProductInfo.objects.filter(shop_id=shop.id).delete()
-
-            for product_data in data['goods']:
-                product = Product.objects.get_or_create(name=product_data['name'])[0]
-                product_info = ProductInfo.objects.create(product_id=product.id, shop_id=shop.id,
-                                                          price=product_data['price'], quantity=product_data['quantity'])
-
-                for key, value in product_data['parameters'].items():
-                    parameter = Parameter.objects.get_or_create(name=key)[0]
-                    ProductParameter.objects.create(product_info_id=product_info.id,
-                                                    parameter_id=parameter.id, value=value)
-
-            return JsonResponse({'Status': 'Товары добавлены'})
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые данные'})
-
-
-
+        if not isinstance(request.data, dict):
+            return JsonResponse({'Status': False, 'Errors': 'Некорректный запрос'}, status=400)
+        url, mode, error = get_import_params(request.data)
+        if error:
+            return JsonResponse({'Status': False, 'Errors': error})
+        job = enqueue_import(request.user.id, url, mode)
+        return JsonResponse({'Status': True, 'job': job.id}, status=202)
 
 
+class ShopUpdateStatusView(APIView):
+    """Класс для просмотра статуса задачи обновления прайса"""
+    permission_classes = [IsShopPermissions]
 
+    def get(self, request, pk, *args, **kwargs):
+        job = ImportJob.objects.filter(id=pk, user_id=request.user.id).select_related('shop').first()
+        if job:
+            return Response(ImportJobSerializer(job).data)
+        return JsonResponse({'Status': False, 'Errors': 'Задача не найдена'}, status=404)
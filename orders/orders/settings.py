@@ -135,8 +135,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication'
+        'backend.authentication.CachedTokenAuthentication'
     ]
 }
 
-AUTH_USER_MODEL = "backend.User"
\ No newline at end of file
+AUTH_USER_MODEL = "backend.User"
+
+# Число потоков для фонового импорта прайс-листов и время в секундах без отметок
+# выполнения, после которого задача считается брошенной остановленным процессом
+# (такие задачи подбирает manage.py recover_import_jobs, например при деплое)
+IMPORT_JOB_WORKERS = 2
+IMPORT_JOB_STALE_AFTER = 900
+
+# Кэш ответов каталога: размер LRU в памяти процесса и необязательный
+# общий кэш из CACHES (например, Redis) со временем жизни записей в секундах
+CATALOG_CACHE_SIZE = 1024
+CATALOG_CACHE_ALIAS = None
+CATALOG_CACHE_TIMEOUT = 300
+
+# Максимальная глубина выдачи поиска по товарам (?q=)
+SEARCH_MAX_RESULTS = 500
+
+# Кэш аутентификации по токену: размер LRU, время жизни записи в секундах и
+# необязательный общий кэш из CACHES (например, Redis), через который сброс
+# токена виден всем процессам сразу. Без общего кэша блокировка пользователя
+# доходит до остальных процессов не позже чем через AUTH_TOKEN_CACHE_TTL
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 5
+AUTH_TOKEN_CACHE_ALIAS = None
+
+# Вывод списков каталога и заказов поставщиков из values_list() без ModelSerializer
+FAST_SERIALIZATION = True
+
+# Размер пачки строк, читаемых из базы при потоковой выдаче списков (?stream=1)
+STREAM_CHUNK_SIZE = 2000
+
+# Загрузка прайсов поставщиков: таймаут соединения и чтения, общее время загрузки
+# в секундах, соединений в пуле на хост, предельный размер распакованного прайса
+# и объём, до которого он держится в памяти, в байтах
+SUPPLIER_FETCH_TIMEOUT = 30
+SUPPLIER_FETCH_MAX_TIME = 300
+SUPPLIER_POOL_SIZE = 4
+SUPPLIER_MAX_SIZE = 100 * 1024 * 1024
+IMPORT_SPOOL_SIZE = 10 * 1024 * 1024
@@ -17,13 +17,16 @@ from django.contrib import admin
 from django.urls import path
 
 from backend.views import ProductView, ShopView, ShopStatusView, ProductInfoView, BasketView, BuyerView, \
-    ShopUpdateView, CategoryView, OrderView, ShopOrdersView, RegisterAccountView, AccountDetailsView, TokenAccountView
+    ShopUpdateView, CategoryView, OrderView, ShopOrdersView, RegisterAccountView, AccountDetailsView, TokenAccountView, \
+    ShopUpdateStatusView
+from backend.async_views import category_view, shop_view, product_view, product_info_view, shop_update
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     path('api/v1/partner/state/', ShopStatusView.as_view(), name='shop_status'),
     path('api/v1/partner/update/', ShopUpdateView.as_view(), name='shop_update'),
+    path('api/v1/partner/update/<int:pk>/', ShopUpdateStatusView.as_view(), name='shop_update_status'),
     path('api/v1/partner/orders/', ShopOrdersView.as_view(), name='shop_orders'),
 
     path('api/v1/categories/', CategoryView.as_view(), name='categories'),
@@ -36,5 +39,12 @@ urlpatterns = [
     path('api/v1/user/contact/', BuyerView.as_view(), name='user-contact'),
     path('api/v1/user/register/', RegisterAccountView.as_view(), name='register'),
     path('api/v1/user/login/', TokenAccountView.as_view(), name='login'),
-    path('api/v1/user/details/', AccountDetailsView.as_view(), name='details')
+    path('api/v1/user/details/', AccountDetailsView.as_view(), name='details'),
+
+    # асинхронные версии для ASGI
+    path('api/v1/async/partner/update/', shop_update, name='async_shop_update'),
+    path('api/v1/async/categories/', category_view, name='async_categories'),
+    path('api/v1/async/shops/', shop_view, name='async_shop'),
+    path('api/v1/async/products/', product_info_view, name='async_products_filter'),
+    path('api/v1/async/product/', product_view, name='async_product'),
 ]